@@ -4,9 +4,17 @@ Handles environment variables, database settings, and application configuration.
 """
 
 import os
+import stat
 import logging
+from functools import lru_cache
 from typing import Optional
-from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def _load_env_file() -> None:
+    """Load the .env file into the environment once per process."""
+    from dotenv import load_dotenv
+    load_dotenv()
 
 
 class Config:
@@ -15,7 +23,7 @@ class Config:
     def __init__(self):
         """Initialize configuration by loading environment variables."""
         # Load .env file if it exists
-        load_dotenv()
+        _load_env_file()
         
         # Database configuration
         self.db_url = os.getenv('DB_URL', 'sqlite:///emails.db')
@@ -48,11 +56,11 @@ class Config:
         errors = []
         
         # Check if credentials file exists
-        if not os.path.exists(self.credentials_file):
+        if not self._is_file(self.credentials_file):
             errors.append(f"Credentials file not found: {self.credentials_file}")
         
         # Check if rules file exists
-        if not os.path.exists(self.rules_file):
+        if not self._is_file(self.rules_file):
             errors.append(f"Rules file not found: {self.rules_file}")
         
         # Validate log level
@@ -64,14 +72,6 @@ class Config:
         if self.max_emails_fetch <= 0:
             errors.append("MAX_EMAILS_FETCH must be greater than 0")
         
-        # Create logs directory if it doesn't exist
-        log_dir = os.path.dirname(self.log_file)
-        if log_dir and not os.path.exists(log_dir):
-            try:
-                os.makedirs(log_dir, exist_ok=True)
-            except OSError as e:
-                errors.append(f"Cannot create log directory: {e}")
-        
         if errors:
             for error in errors:
                 print(f"Configuration Error: {error}")
@@ -79,8 +79,20 @@ class Config:
         
         return True
     
+    @staticmethod
+    def _is_file(path: str) -> bool:
+        """Check that path is an existing regular file using a single stat call."""
+        try:
+            return stat.S_ISREG(os.stat(path).st_mode)
+        except OSError:
+            return False
+    
     def setup_logging(self) -> None:
-        """Setup logging configuration."""
+        """Setup logging configuration, creating the log directory if needed."""
+        log_dir = os.path.dirname(self.log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        
         logging.basicConfig(
             level=getattr(logging, self.log_level),
             format=self.log_format,
@@ -98,4 +110,4 @@ class Config:
 
 
 # Global configuration instance
-config = Config()
\ No newline at end of file
+config = Config()
@@ -3,12 +3,25 @@ Database models and ORM setup for Gmail Rule Engine.
 Uses SQLAlchemy for database operations with SQLite by default.
 """
 
+import ast
+import json
 import logging
-from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, Session, relationship
+import threading
+from typing import Iterable, Iterator, List, Optional, Dict, Any
+from sqlalchemy import (
+    bindparam, create_engine, event, insert, select, update, text, func,
+    Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, JSON
+)
+from cachetools import TTLCache
+try:
+    import orjson
+except ImportError:  # Optional speedup; the stdlib json module is used without it
+    orjson = None
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, Session, relationship
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import ColumnElement
 
 from config import config
 
@@ -16,6 +29,14 @@ logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# JSON column type; stored as JSONB on PostgreSQL so it can be GIN-indexed
+JSONType = JSON().with_variant(JSONB(), 'postgresql')
+
+
+def _orjson_dumps(value: Any) -> str:
+    """Serialize a JSON column value with orjson."""
+    return orjson.dumps(value).decode()
+
 
 class Email(Base):
     """Email model representing stored Gmail messages."""
@@ -31,9 +52,13 @@ class Email(Base):
     body = Column(Text, nullable=True)
     received_at = Column(DateTime, nullable=False, index=True)
     is_read = Column(Boolean, default=False, nullable=False)
-    labels = Column(Text, nullable=True)  # JSON string of label names
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+    labels = Column(JSONType, nullable=True)  # List of label names
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    # Load database-generated timestamps via RETURNING so they stay
+    # available on instances after the session closes
+    __mapper_args__ = {'eager_defaults': True}
     
     # Relationship to rules applied
     rules_applied = relationship("RuleApplied", back_populates="email", cascade="all, delete-orphan")
@@ -59,17 +84,52 @@ class Email(Base):
         }
 
 
+# Label membership index for `labels ? 'INBOX'` queries (PostgreSQL only)
+Index('ix_emails_labels', Email.labels, postgresql_using='gin').ddl_if(dialect='postgresql')
+
+
+# Connection pragmas applied to every new SQLite connection: WAL lets readers
+# run alongside the writer and NORMAL sync skips an fsync per commit
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+]
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Configure a freshly opened SQLite DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+# SQLite user_version from which labels/actions_applied hold valid JSON
+SQLITE_JSON_COLUMNS_VERSION = 1
+
+
 class RuleApplied(Base):
     """Model to track which rules have been applied to which emails."""
     
     __tablename__ = 'rules_applied'
+    __table_args__ = (
+        # Serves both per-email lookups and (email, rule) dedup checks
+        Index('ix_rules_applied_email_rule', 'email_id', 'rule_id'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     email_id = Column(Integer, ForeignKey('emails.id'), nullable=False)
     rule_id = Column(String(255), nullable=False)  # Rule identifier from JSON
     rule_name = Column(String(255), nullable=True)  # Human-readable rule name
-    actions_applied = Column(Text, nullable=False)  # JSON string of applied actions
-    applied_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    actions_applied = Column(JSONType, nullable=False)  # List of applied actions
+    applied_at = Column(DateTime, default=func.now(), server_default=func.now(), nullable=False)
+    
+    __mapper_args__ = {'eager_defaults': True}
     
     # Relationship to email
     email = relationship("Email", back_populates="rules_applied")
@@ -89,6 +149,11 @@ class RuleApplied(Base):
         }
 
 
+# Lookups run once per email, built once so only their parameters change per call
+SELECT_EMAIL_BY_GMAIL_ID = select(Email).where(Email.gmail_id == bindparam('gmail_id')).limit(1)
+SELECT_RULES_FOR_EMAIL = select(RuleApplied).where(RuleApplied.email_id == bindparam('email_id'))
+
+
 class DatabaseManager:
     """Database manager class for handling database operations."""
     
@@ -101,23 +166,44 @@ class DatabaseManager:
         """
         self.db_url = db_url or config.db_url
         self.engine = None
+        self._sessionmaker = None
         self.session_factory = None
+        
+        # Gmail IDs recently seen in the database, so overlapping fetches can
+        # skip the existence SELECT
+        self._known_gmail_ids = TTLCache(maxsize=10000, ttl=300)
+        self._known_gmail_ids_lock = threading.Lock()
+        
         self._initialize_database()
     
     def _initialize_database(self) -> None:
         """Initialize database connection and create tables."""
         try:
+            json_options = {}
+            if orjson is not None:
+                # Labels and applied actions are (de)serialized for every row
+                json_options = {'json_serializer': _orjson_dumps, 'json_deserializer': orjson.loads}
+            
             self.engine = create_engine(
                 self.db_url,
                 echo=config.debug_mode,
-                pool_pre_ping=True
+                pool_pre_ping=True,
+                **json_options
             )
             
+            if self.engine.dialect.name == 'sqlite':
+                event.listen(self.engine, 'connect', _apply_sqlite_pragmas)
+            
             # Create all tables
             Base.metadata.create_all(self.engine)
             
-            # Create session factory
-            self.session_factory = sessionmaker(bind=self.engine)
+            if self.engine.dialect.name == 'sqlite':
+                self._upgrade_sqlite_json_columns()
+            
+            # Create thread-local session registry; keep attributes loaded after
+            # commit so returned objects stay usable once the session is closed
+            self._sessionmaker = sessionmaker(bind=self.engine, expire_on_commit=False)
+            self.session_factory = scoped_session(self._sessionmaker)
             
             logger.info(f"Database initialized successfully: {self.db_url}")
             
@@ -125,12 +211,85 @@ class DatabaseManager:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
+    def _upgrade_sqlite_json_columns(self) -> None:
+        """Convert values written before labels/actions became JSON columns."""
+        # The conversion scans both tables, so it runs once per database file
+        with self.engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        if version >= SQLITE_JSON_COLUMNS_VERSION:
+            return
+        
+        with self.engine.begin() as connection:
+            # Labels used to default to an empty string rather than NULL
+            connection.execute(text("UPDATE emails SET labels = NULL WHERE labels = ''"))
+            
+            # Actions used to be stored as a Python list repr
+            legacy_rows = connection.execute(text(
+                "SELECT id, actions_applied FROM rules_applied WHERE json_valid(actions_applied) = 0"
+            )).all()
+            for row_id, actions in legacy_rows:
+                try:
+                    converted = json.dumps(ast.literal_eval(actions))
+                except (ValueError, SyntaxError):
+                    converted = json.dumps([actions])
+                connection.execute(
+                    text("UPDATE rules_applied SET actions_applied = :actions WHERE id = :id"),
+                    {'actions': converted, 'id': row_id}
+                )
+            
+            connection.exec_driver_sql(f"PRAGMA user_version = {SQLITE_JSON_COLUMNS_VERSION}")
+    
     def get_session(self) -> Session:
-        """Get a new database session."""
+        """
+        Get the database session for the current thread.
+        
+        Sessions come from a thread-local registry, so repeated calls on the
+        same thread reuse one session instead of building a new one each time.
+        Use it as a context manager so it is closed (and its connection
+        returned to the pool) when the operation finishes.
+        
+        Because the session is shared, leaving any such block closes it for
+        every caller on the thread. The DatabaseManager methods each open and
+        close it, so they must not be called from inside another get_session()
+        block; doing so expunges the outer block's objects. Code that needs a
+        session across other database calls should use one of its own, as
+        iter_emails does.
+        """
         if not self.session_factory:
             raise RuntimeError("Database not initialized")
         return self.session_factory()
     
+    @staticmethod
+    def _email_row(email_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map fetched email data onto Email column names."""
+        return {
+            'gmail_id': email_data['gmail_id'],
+            'thread_id': email_data['thread_id'],
+            'from_address': email_data['from'],
+            'to_address': email_data['to'],
+            'subject': email_data['subject'],
+            'body': email_data.get('body', ''),
+            'received_at': email_data['received_at'],
+            'is_read': email_data.get('is_read', False),
+            'labels': email_data.get('labels')
+        }
+    
+    def _remember_gmail_ids(self, gmail_ids) -> None:
+        """Record Gmail IDs known to be stored in the database."""
+        with self._known_gmail_ids_lock:
+            for gmail_id in gmail_ids:
+                self._known_gmail_ids[gmail_id] = True
+    
+    def _is_known_gmail_id(self, gmail_id: str) -> bool:
+        """Check whether a Gmail ID was recently seen in the database."""
+        with self._known_gmail_ids_lock:
+            return gmail_id in self._known_gmail_ids
+    
+    def clear_email_cache(self) -> None:
+        """Forget cached Gmail IDs, e.g. after emails are deleted."""
+        with self._known_gmail_ids_lock:
+            self._known_gmail_ids.clear()
+    
     def save_email(self, email_data: Dict[str, Any]) -> Optional[Email]:
         """
         Save email to database.
@@ -141,73 +300,220 @@ class DatabaseManager:
         Returns:
             Email object if saved successfully, None otherwise
         """
-        session = self.get_session()
+        gmail_id = email_data['gmail_id']
         try:
-            # Check if email already exists
-            existing_email = session.query(Email).filter_by(
-                gmail_id=email_data['gmail_id']
-            ).first()
-            
-            if existing_email:
-                logger.debug(f"Email {email_data['gmail_id']} already exists")
-                return existing_email
-            
-            # Create new email
-            email = Email(
-                gmail_id=email_data['gmail_id'],
-                thread_id=email_data['thread_id'],
-                from_address=email_data['from'],
-                to_address=email_data['to'],
-                subject=email_data['subject'],
-                body=email_data.get('body', ''),
-                received_at=email_data['received_at'],
-                is_read=email_data.get('is_read', False),
-                labels=email_data.get('labels', '')
-            )
+            with self.get_session() as session, session.begin():
+                email = None
+                
+                dialect = self.engine.dialect
+                if dialect.name in ('postgresql', 'sqlite') and dialect.insert_returning:
+                    # Insert and detect duplicates in one statement
+                    email = session.scalars(
+                        self._insert_new_emails()
+                        .values(**self._email_row(email_data))
+                        .returning(Email)
+                    ).first()
+                
+                if email is None:
+                    # Check if email already exists
+                    existing_email = session.scalars(
+                        SELECT_EMAIL_BY_GMAIL_ID, {'gmail_id': gmail_id}
+                    ).first()
+                    
+                    if existing_email:
+                        logger.debug(f"Email {gmail_id} already exists")
+                        self._remember_gmail_ids([gmail_id])
+                        return existing_email
+                    
+                    # Create new email
+                    email = Email(**self._email_row(email_data))
+                    session.add(email)
             
-            session.add(email)
-            session.commit()
+            self._remember_gmail_ids([gmail_id])
             logger.info(f"Saved email: {email.id} from {email.from_address}")
             return email
             
         except SQLAlchemyError as e:
-            session.rollback()
             logger.error(f"Failed to save email: {e}")
             return None
-        finally:
-            session.close()
     
-    def get_emails(self, limit: int = None, offset: int = 0) -> List[Email]:
+    def _insert_new_emails(self):
+        """
+        Build an INSERT into emails that skips rows whose Gmail ID already exists.
+        
+        Returns:
+            Insert statement; dialects without ON CONFLICT get a plain INSERT
+        """
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            return pg_insert(Email).on_conflict_do_nothing(index_elements=['gmail_id'])
+        if dialect == 'sqlite':
+            return sqlite_insert(Email).on_conflict_do_nothing(index_elements=['gmail_id'])
+        return insert(Email)
+    
+    def _execute_email_insert(self, session: Session, rows: List[Dict[str, Any]]) -> int:
+        """
+        Insert email rows, skipping conflicts, and count the rows actually written.
+        
+        Args:
+            session: Session with an open transaction
+            rows: Column values for each email
+            
+        Returns:
+            Number of emails inserted
+        """
+        stmt = self._insert_new_emails()
+        
+        if self.engine.dialect.insert_executemany_returning:
+            # Rows skipped by ON CONFLICT return nothing, so this count is exact
+            return len(session.execute(stmt.returning(Email.id), rows).all())
+        
+        session.execute(stmt, rows)
+        return len(rows)
+    
+    def save_emails(self, emails_data: Iterable[Dict[str, Any]]) -> int:
+        """
+        Save a batch of emails to database in a single transaction.
+        
+        Existing emails are detected with one SELECT over the batch's Gmail IDs
+        (skipping IDs seen recently) and new ones are written with a single
+        multi-row INSERT that ignores rows another writer stored in between.
+        
+        Args:
+            emails_data: Dictionaries containing email data (any iterable)
+            
+        Returns:
+            Number of new emails saved
+        """
+        if not isinstance(emails_data, list):
+            emails_data = list(emails_data)
+        if not emails_data:
+            return 0
+        
+        candidates = [
+            email_data for email_data in emails_data
+            if not self._is_known_gmail_id(email_data['gmail_id'])
+        ]
+        
+        try:
+            new_rows = []
+            saved_count = 0
+            if candidates:
+                with self.get_session() as session, session.begin():
+                    gmail_ids = [email_data['gmail_id'] for email_data in candidates]
+                    existing_ids = {
+                        gmail_id for gmail_id, in session.query(Email.gmail_id).filter(
+                            Email.gmail_id.in_(gmail_ids)
+                        )
+                    }
+                    
+                    for email_data in candidates:
+                        gmail_id = email_data['gmail_id']
+                        if gmail_id in existing_ids:
+                            continue
+                        existing_ids.add(gmail_id)
+                        new_rows.append(self._email_row(email_data))
+                    
+                    if new_rows:
+                        saved_count = self._execute_email_insert(session, new_rows)
+            
+            self._remember_gmail_ids(email_data['gmail_id'] for email_data in emails_data)
+            logger.info(f"Saved {saved_count} new emails "
+                        f"({len(emails_data) - saved_count} already existed)")
+            return saved_count
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to save emails: {e}")
+            return 0
+    
+    def _emails_query(self, limit: int = None, offset: int = 0,
+                      filter_clause: Optional[ColumnElement] = None):
+        """Build the newest-first email SELECT shared by get_emails and iter_emails."""
+        stmt = select(Email).order_by(Email.received_at.desc())
+        
+        if filter_clause is not None:
+            window_clause = self._newest_emails_clause(limit, offset)
+            if window_clause is not None:
+                stmt = stmt.where(window_clause)
+            return stmt.where(filter_clause)
+        
+        if offset:
+            stmt = stmt.offset(offset)
+        if limit:
+            stmt = stmt.limit(limit)
+        
+        return stmt
+    
+    @staticmethod
+    def _newest_emails_clause(limit: int = None, offset: int = 0) -> Optional[ColumnElement]:
+        """
+        Restrict emails to a window of the newest-first ordering of all emails.
+        
+        Used when a filter is also applied, so that limit and offset keep
+        selecting the newest emails rather than the newest matching ones.
+        
+        Args:
+            limit: Size of the window
+            offset: Number of newest emails before the window starts
+            
+        Returns:
+            WHERE clause, or None if neither limit nor offset is set
+        """
+        if not limit and not offset:
+            return None
+        
+        window = select(Email.id).order_by(Email.received_at.desc())
+        if offset:
+            window = window.offset(offset)
+        if limit:
+            window = window.limit(limit)
+        return Email.id.in_(window)
+    
+    def get_emails(self, limit: int = None, offset: int = 0,
+                   filter_clause: Optional[ColumnElement] = None) -> List[Email]:
         """
         Get emails from database.
         
         Args:
-            limit: Maximum number of emails to return
-            offset: Number of emails to skip
+            limit: Maximum number of emails to return; with filter_clause, only
+                the newest limit emails are considered
+            offset: Number of newest emails to skip, before any filter_clause
+            filter_clause: Optional WHERE clause restricting the emails returned
             
         Returns:
             List of Email objects
         """
-        session = self.get_session()
-        try:
-            query = session.query(Email).order_by(Email.received_at.desc())
+        with self.get_session() as session:
+            return list(session.scalars(self._emails_query(limit, offset, filter_clause)))
+    
+    def iter_emails(self, limit: int = None, offset: int = 0,
+                    filter_clause: Optional[ColumnElement] = None,
+                    batch_size: int = 1000) -> Iterator[Email]:
+        """
+        Stream emails from database, fetching batch_size rows at a time.
+        
+        The rows are read through a session of their own, so database calls
+        made while iterating do not close the cursor. Exhaust or close the
+        iterator to release its connection.
+        
+        Args:
+            limit: Maximum number of emails to return; with filter_clause, only
+                the newest limit emails are considered
+            offset: Number of newest emails to skip, before any filter_clause
+            filter_clause: Optional WHERE clause restricting the emails returned
+            batch_size: Number of rows fetched per round trip
             
-            if offset:
-                query = query.offset(offset)
-            if limit:
-                query = query.limit(limit)
-                
-            return query.all()
-        finally:
-            session.close()
+        Yields:
+            Email objects, newest first
+        """
+        stmt = self._emails_query(limit, offset, filter_clause)
+        with self._sessionmaker() as session:
+            yield from session.scalars(stmt).yield_per(batch_size)
     
     def get_email_by_gmail_id(self, gmail_id: str) -> Optional[Email]:
         """Get email by Gmail ID."""
-        session = self.get_session()
-        try:
-            return session.query(Email).filter_by(gmail_id=gmail_id).first()
-        finally:
-            session.close()
+        with self.get_session() as session:
+            return session.scalars(SELECT_EMAIL_BY_GMAIL_ID, {'gmail_id': gmail_id}).first()
     
     def update_email_status(self, email_id: int, is_read: bool) -> bool:
         """
@@ -220,22 +526,46 @@ class DatabaseManager:
         Returns:
             True if updated successfully, False otherwise
         """
-        session = self.get_session()
         try:
-            email = session.query(Email).filter_by(id=email_id).first()
-            if email:
+            with self.get_session() as session, session.begin():
+                email = session.query(Email).filter_by(id=email_id).first()
+                if not email:
+                    return False
                 email.is_read = is_read
-                email.updated_at = datetime.now(timezone.utc)
-                session.commit()
-                logger.info(f"Updated email {email_id} read status: {is_read}")
-                return True
-            return False
+            
+            logger.info(f"Updated email {email_id} read status: {is_read}")
+            return True
+            
         except SQLAlchemyError as e:
-            session.rollback()
             logger.error(f"Failed to update email status: {e}")
             return False
-        finally:
-            session.close()
+    
+    def update_emails_status(self, email_ids: List[int], is_read: bool) -> int:
+        """
+        Update the read status of several emails with a single UPDATE.
+        
+        Args:
+            email_ids: Email IDs
+            is_read: New read status
+            
+        Returns:
+            Number of emails updated
+        """
+        if not email_ids:
+            return 0
+        
+        try:
+            with self.get_session() as session, session.begin():
+                result = session.execute(
+                    update(Email).where(Email.id.in_(email_ids)).values(is_read=is_read)
+                )
+            
+            logger.info(f"Updated read status of {result.rowcount} emails: {is_read}")
+            return result.rowcount
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to update email statuses: {e}")
+            return 0
     
     def log_rule_applied(self, email_id: int, rule_id: str, rule_name: str, 
                         actions: List[str]) -> Optional[RuleApplied]:
@@ -251,56 +581,112 @@ class DatabaseManager:
         Returns:
             RuleApplied object if logged successfully, None otherwise
         """
-        session = self.get_session()
         try:
             rule_applied = RuleApplied(
                 email_id=email_id,
                 rule_id=rule_id,
                 rule_name=rule_name,
-                actions_applied=str(actions)  # Convert to string for storage
+                actions_applied=actions
             )
             
-            session.add(rule_applied)
-            session.commit()
-            
-            # Refresh the object to ensure all attributes are loaded
-            session.refresh(rule_applied)
-            
-            # Create a detached copy to avoid DetachedInstanceError
-            detached_rule = RuleApplied(
-                email_id=rule_applied.email_id,
-                rule_id=rule_applied.rule_id,
-                rule_name=rule_applied.rule_name,
-                actions_applied=rule_applied.actions_applied,
-                applied_at=rule_applied.applied_at
-            )
-            detached_rule.id = rule_applied.id
+            # The flush returns the primary key and applied_at onto the
+            # instance; no refresh needed
+            with self.get_session() as session, session.begin():
+                session.add(rule_applied)
             
             logger.info(f"Logged rule '{rule_name}' applied to email {email_id}")
-            return detached_rule
+            return rule_applied
             
         except SQLAlchemyError as e:
-            session.rollback()
             logger.error(f"Failed to log rule application: {e}")
             return None
-        finally:
-            session.close()
+    
+    def log_rules_applied(self, rules_applied: List[Dict[str, Any]]) -> int:
+        """
+        Log a batch of rule applications with a single multi-row INSERT.
+        
+        Args:
+            rules_applied: List of dictionaries with email_id, rule_id,
+                rule_name and actions keys
+            
+        Returns:
+            Number of rule applications logged
+        """
+        if not rules_applied:
+            return 0
+        
+        rows = [
+            {
+                'email_id': entry['email_id'],
+                'rule_id': entry['rule_id'],
+                'rule_name': entry['rule_name'],
+                'actions_applied': entry['actions']
+            }
+            for entry in rules_applied
+        ]
+        
+        try:
+            with self.get_session() as session, session.begin():
+                session.execute(insert(RuleApplied), rows)
+            
+            logger.info(f"Logged {len(rows)} rule applications")
+            return len(rows)
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to log rule applications: {e}")
+            return 0
     
     def get_rules_for_email(self, email_id: int) -> List[RuleApplied]:
         """Get all rules applied to a specific email."""
-        session = self.get_session()
-        try:
-            return session.query(RuleApplied).filter_by(email_id=email_id).all()
-        finally:
-            session.close()
+        with self.get_session() as session:
+            return session.scalars(SELECT_RULES_FOR_EMAIL, {'email_id': email_id}).all()
     
-    def get_email_count(self) -> int:
-        """Get total number of emails in database."""
-        session = self.get_session()
-        try:
-            return session.query(Email).count()
-        finally:
-            session.close()
+    def get_rules_for_emails(self, email_ids: List[int]) -> Dict[int, List[RuleApplied]]:
+        """
+        Get the rules applied to several emails with a single query.
+        
+        Args:
+            email_ids: Email IDs
+            
+        Returns:
+            Dictionary mapping each email ID to its applied rules; emails with
+            none are left out
+        """
+        if not email_ids:
+            return {}
+        
+        stmt = (
+            select(RuleApplied)
+            .where(RuleApplied.email_id.in_(email_ids))
+            .order_by(RuleApplied.id)
+        )
+        
+        rules_by_email = {}
+        with self.get_session() as session:
+            for rule_applied in session.scalars(stmt):
+                rules_by_email.setdefault(rule_applied.email_id, []).append(rule_applied)
+        return rules_by_email
+    
+    def get_email_count(self, filter_clause: Optional[ColumnElement] = None,
+                        limit: int = None, offset: int = 0) -> int:
+        """
+        Get total number of emails in database.
+        
+        Args:
+            filter_clause: Optional WHERE clause restricting the emails counted
+            limit: Only count within the newest limit emails (after offset)
+            offset: Number of newest emails to leave out
+        """
+        # Plain COUNT(*) rather than Query.count()'s SELECT-in-subquery
+        stmt = select(func.count()).select_from(Email)
+        window_clause = self._newest_emails_clause(limit, offset)
+        if window_clause is not None:
+            stmt = stmt.where(window_clause)
+        if filter_clause is not None:
+            stmt = stmt.where(filter_clause)
+        
+        with self.get_session() as session:
+            return session.scalar(stmt)
 
 
 # Global database manager instance
@@ -4,24 +4,53 @@ Handles OAuth2 authentication, email retrieval, and Gmail operations.
 """
 
 import os
-import json
 import base64
 import logging
-import email
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-from email.mime.text import MIMEText
+from email.utils import parsedate_to_datetime
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+try:
+    import pybase64
+except ImportError:  # Optional SIMD decoder; the stdlib base64 is used without it
+    pybase64 = None
 
-import googleapiclient.discovery
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+# The Google client libraries take ~100 ms to import, so they are loaded in
+# _authenticate; only the lightweight error module is needed up front
 from googleapiclient.errors import HttpError
 
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Socket timeout (seconds) for Gmail API requests
+HTTP_TIMEOUT = 30
+
+# Maximum number of calls Gmail accepts in a single batch HTTP request
+BATCH_REQUEST_LIMIT = 100
+
+# Maximum number of message IDs accepted by a single messages.batchModify call
+BATCH_MODIFY_LIMIT = 1000
+
+# Actions that only add or remove labels, so can go through messages.batchModify
+LABEL_ACTIONS = frozenset({'mark_as_read', 'mark_as_unread', 'move', 'archive'})
+
+# Maximum page size accepted by messages.list
+LIST_PAGE_LIMIT = 500
+
+# Headers read from each message; metadata requests ask for only these
+METADATA_HEADERS = ['From', 'To', 'Subject', 'Date']
+PARSED_HEADERS = frozenset(header.lower() for header in METADATA_HEADERS)
+
+
+def _urlsafe_b64decode(data: str) -> bytes:
+    """Decode base64url data, using pybase64 when it is installed."""
+    if pybase64 is not None:
+        try:
+            return pybase64.urlsafe_b64decode(data)
+        except Exception:
+            pass  # Let the stdlib decoder handle or report unusual input
+    return base64.urlsafe_b64decode(data)
+
 
 class GmailService:
     """Gmail API service wrapper."""
@@ -30,10 +59,19 @@ class GmailService:
         """Initialize Gmail service with authentication."""
         self.service = None
         self.credentials = None
+        self._label_map: Optional[Dict[str, str]] = None
+        self._label_ids_by_name: Optional[Dict[str, str]] = None
         self._authenticate()
     
     def _authenticate(self) -> None:
         """Authenticate with Gmail API using OAuth2."""
+        import google_auth_httplib2
+        import googleapiclient.discovery
+        import httplib2
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        
         creds = None
         
         # Load existing token if available
@@ -72,111 +110,195 @@ class GmailService:
         with open(config.token_file, 'w') as token:
             token.write(creds.to_json())
         
-        # Build Gmail service
+        # Build Gmail service on one authorized HTTP client so every request
+        # (including batches) reuses the same keep-alive connection
         self.credentials = creds
+        authorized_http = google_auth_httplib2.AuthorizedHttp(
+            creds, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+        )
         self.service = googleapiclient.discovery.build(
-            'gmail', 'v1', credentials=creds
+            'gmail', 'v1', http=authorized_http
         )
         logger.info("Gmail service initialized successfully")
     
-    def fetch_emails(self, max_results: int = None, query: str = '') -> List[Dict[str, Any]]:
+    def fetch_emails(self, max_results: int = None, query: str = '',
+                     include_body: bool = True) -> List[Dict[str, Any]]:
         """
         Fetch emails from Gmail inbox.
         
         Args:
             max_results: Maximum number of emails to fetch
             query: Gmail search query (e.g., 'is:unread', 'from:example@gmail.com')
+            include_body: Download message bodies. When False only headers and
+                labels are requested, which keeps responses much smaller
             
         Returns:
             List of email dictionaries
         """
+        emails = []
+        for batch in self.iter_email_batches(max_results, query, include_body):
+            emails.extend(batch)
+        
+        logger.info(f"Successfully fetched {len(emails)} emails")
+        return emails
+    
+    def iter_email_batches(self, max_results: int = None, query: str = '',
+                           include_body: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Fetch emails from Gmail inbox, yielding them one batch at a time.
+        
+        Pages through messages.list with pageToken until max_results messages
+        have been listed, so callers can store each batch while the next one
+        is being fetched rather than waiting for the whole mailbox.
+        
+        Args:
+            max_results: Maximum number of emails to fetch
+            query: Gmail search query (e.g., 'is:unread', 'from:example@gmail.com')
+            include_body: Whether to download message bodies
+            
+        Yields:
+            Lists of at most BATCH_REQUEST_LIMIT email dictionaries
+        """
         if not self.service:
             raise RuntimeError("Gmail service not initialized")
         
-        max_results = max_results or config.max_emails_fetch
-        emails = []
+        remaining = max_results or config.max_emails_fetch
+        page_token = None
         
         try:
-            # Get list of message IDs
-            results = self.service.users().messages().list(
-                userId='me',
-                maxResults=max_results,
-                q=query
-            ).execute()
-            
-            messages = results.get('messages', [])
-            logger.info(f"Found {len(messages)} messages to fetch")
-            
-            for message in messages:
-                try:
-                    email_data = self._fetch_email_details(message['id'])
-                    if email_data:
-                        emails.append(email_data)
-                except Exception as e:
-                    logger.error(f"Failed to fetch email {message['id']}: {e}")
-                    continue
-            
-            logger.info(f"Successfully fetched {len(emails)} emails")
-            return emails
-            
+            while remaining > 0:
+                # Get the next page of message IDs
+                results = self.service.users().messages().list(
+                    userId='me',
+                    maxResults=min(remaining, LIST_PAGE_LIMIT),
+                    q=query,
+                    pageToken=page_token
+                ).execute()
+                
+                messages = results.get('messages', [])
+                logger.info(f"Found {len(messages)} messages to fetch")
+                
+                # Fetch message details in batches to avoid one round-trip per email
+                for start in range(0, len(messages), BATCH_REQUEST_LIMIT):
+                    chunk = messages[start:start + BATCH_REQUEST_LIMIT]
+                    yield self._fetch_email_details_batch(chunk, include_body)
+                
+                remaining -= len(messages)
+                page_token = results.get('nextPageToken')
+                if not messages or not page_token:
+                    break
+                    
         except HttpError as error:
             logger.error(f"An error occurred while fetching emails: {error}")
-            return []
     
-    def _fetch_email_details(self, message_id: str) -> Optional[Dict[str, Any]]:
+    def _fetch_email_details_batch(self, messages: List[Dict[str, Any]],
+                                   include_body: bool = True) -> List[Dict[str, Any]]:
         """
-        Fetch detailed information for a specific email.
+        Fetch details for a chunk of messages with a single batch HTTP request.
+        
+        Args:
+            messages: Message references from messages.list (at most BATCH_REQUEST_LIMIT)
+            include_body: Whether to request and decode message bodies
+            
+        Returns:
+            List of email dictionaries in the order the messages were requested
+        """
+        emails = []
+        
+        def on_message(request_id: str, response: Dict[str, Any], exception: Exception) -> None:
+            if exception is not None:
+                logger.error(f"Failed to fetch email {request_id}: {exception}")
+                return
+            try:
+                email_data = self._parse_message(response, include_body)
+                if email_data:
+                    emails.append(email_data)
+            except Exception as e:
+                logger.error(f"Failed to parse email {request_id}: {e}")
+        
+        batch = self.service.new_batch_http_request(callback=on_message)
+        for message in messages:
+            batch.add(
+                self._message_get_request(message['id'], include_body),
+                request_id=message['id']
+            )
+        batch.execute()
+        
+        return emails
+    
+    def _message_get_request(self, message_id: str, include_body: bool = True):
+        """
+        Build a messages.get request that asks only for the fields we parse.
         
         Args:
             message_id: Gmail message ID
+            include_body: Request the full MIME payload; otherwise metadata only
             
         Returns:
-            Dictionary containing email details
+            Unexecuted Gmail API request
         """
-        try:
-            message = self.service.users().messages().get(
+        messages = self.service.users().messages()
+        if include_body:
+            return messages.get(
                 userId='me',
                 id=message_id,
-                format='full'
-            ).execute()
-            
-            # Extract headers
-            headers = {
-                header['name'].lower(): header['value']
-                for header in message['payload'].get('headers', [])
-            }
-            
-            # Extract body
-            body = self._extract_email_body(message['payload'])
-            
-            # Parse date
-            date_str = headers.get('date', '')
-            received_at = self._parse_email_date(date_str)
-            
-            # Check if email is read
-            is_read = 'UNREAD' not in message.get('labelIds', [])
-            
-            # Get labels
-            label_ids = message.get('labelIds', [])
-            labels = self._get_label_names(label_ids)
-            
-            email_data = {
-                'gmail_id': message_id,
-                'thread_id': message.get('threadId', ''),
-                'from': headers.get('from', ''),
-                'to': headers.get('to', ''),
-                'subject': headers.get('subject', ''),
-                'body': body,
-                'received_at': received_at,
-                'is_read': is_read,
-                'labels': json.dumps(labels)
-            }
-            
-            return email_data
+                format='full',
+                fields='id,threadId,labelIds,internalDate,payload'
+            )
+        return messages.get(
+            userId='me',
+            id=message_id,
+            format='metadata',
+            metadataHeaders=METADATA_HEADERS,
+            fields='id,threadId,labelIds,internalDate,payload/headers'
+        )
+    
+    def _parse_message(self, message: Dict[str, Any], include_body: bool = True) -> Dict[str, Any]:
+        """
+        Convert a Gmail API message resource into an email dictionary.
+        
+        Args:
+            message: Message resource returned by messages.get
+            include_body: Whether the message carries a body to decode
             
-        except HttpError as error:
-            logger.error(f"Error fetching email details for {message_id}: {error}")
-            return None
+        Returns:
+            Dictionary containing email details
+        """
+        # Extract only the headers we store; full messages carry dozens
+        headers = {}
+        for header in message['payload'].get('headers', []):
+            name = header['name'].lower()
+            if name in PARSED_HEADERS:
+                headers[name] = header['value']
+        
+        # Extract body (metadata-only responses have none)
+        body = self._extract_email_body(message['payload']) if include_body else None
+        
+        # Prefer Gmail's internalDate (epoch milliseconds) over parsing the Date header
+        internal_date = message.get('internalDate')
+        if internal_date:
+            received_at = datetime.fromtimestamp(int(internal_date) / 1000, tz=timezone.utc)
+        else:
+            received_at = self._parse_email_date(headers.get('date', ''))
+        
+        # Check if email is read
+        is_read = 'UNREAD' not in message.get('labelIds', [])
+        
+        # Get labels
+        label_ids = message.get('labelIds', [])
+        labels = self._get_label_names(label_ids)
+        
+        return {
+            'gmail_id': message['id'],
+            'thread_id': message.get('threadId', ''),
+            'from': headers.get('from', ''),
+            'to': headers.get('to', ''),
+            'subject': headers.get('subject', ''),
+            'body': body,
+            'received_at': received_at,
+            'is_read': is_read,
+            'labels': labels
+        }
     
     def _extract_email_body(self, payload: Dict[str, Any]) -> str:
         """
@@ -188,32 +310,39 @@ class GmailService:
         Returns:
             Email body text
         """
-        body = ''
-        
         try:
-            # Handle multipart messages
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        data = part['body'].get('data', '')
-                        if data:
-                            body += base64.urlsafe_b64decode(data).decode('utf-8')
-                    elif part['mimeType'] == 'text/html' and not body:
-                        # Use HTML as fallback if no plain text
-                        data = part['body'].get('data', '')
-                        if data:
-                            body = base64.urlsafe_b64decode(data).decode('utf-8')
-            
             # Handle single part messages
-            elif payload.get('body', {}).get('data'):
-                data = payload['body']['data']
-                body = base64.urlsafe_b64decode(data).decode('utf-8')
+            if 'parts' not in payload:
+                data = payload.get('body', {}).get('data')
+                return _urlsafe_b64decode(data).decode('utf-8', errors='replace') if data else ''
+            
+            # Walk nested multipart trees (e.g. forwarded mail) in document order
+            plain_parts = []
+            html_parts = []
+            stack = list(reversed(payload['parts']))
+            while stack:
+                part = stack.pop()
+                if 'parts' in part:
+                    stack.extend(reversed(part['parts']))
+                    continue
+                
+                data = part.get('body', {}).get('data')
+                if not data:
+                    continue
+                if part.get('mimeType') == 'text/plain':
+                    plain_parts.append(data)
+                elif part.get('mimeType') == 'text/html':
+                    html_parts.append(data)
+            
+            # Use HTML as fallback if no plain text; decode once after joining
+            chosen_parts = plain_parts or html_parts[:1]
+            return b''.join(
+                _urlsafe_b64decode(data) for data in chosen_parts
+            ).decode('utf-8', errors='replace')
                 
         except Exception as e:
             logger.warning(f"Failed to extract email body: {e}")
-            body = ''
-        
-        return body
+            return ''
     
     def _parse_email_date(self, date_str: str) -> datetime:
         """
@@ -227,7 +356,6 @@ class GmailService:
         """
         try:
             # Parse using email.utils for RFC 2822 format
-            from email.utils import parsedate_to_datetime
             return parsedate_to_datetime(date_str)
         except Exception as e:
             logger.warning(f"Failed to parse date '{date_str}': {e}")
@@ -244,16 +372,206 @@ class GmailService:
             List of label names
         """
         try:
-            results = self.service.users().labels().list(userId='me').execute()
-            labels = results.get('labels', [])
-            
-            label_map = {label['id']: label['name'] for label in labels}
+            label_map = self._get_label_map()
             return [label_map.get(label_id, label_id) for label_id in label_ids]
             
         except HttpError as error:
             logger.error(f"Error fetching labels: {error}")
             return label_ids
     
+    def _get_label_map(self) -> Dict[str, str]:
+        """
+        Get the label ID to name mapping, fetching it from Gmail on first use.
+        
+        Returns:
+            Dictionary mapping label IDs to label names
+        """
+        if self._label_map is None:
+            results = self.service.users().labels().list(userId='me').execute()
+            self._label_map = {
+                label['id']: label['name'] for label in results.get('labels', [])
+            }
+        return self._label_map
+    
+    def _get_label_ids_by_name(self) -> Dict[str, str]:
+        """
+        Get the label name to ID mapping, derived from the cached label map.
+        
+        Returns:
+            Dictionary mapping label names to label IDs
+        """
+        if self._label_ids_by_name is None:
+            self._label_ids_by_name = {
+                name: label_id for label_id, name in self._get_label_map().items()
+            }
+        return self._label_ids_by_name
+    
+    def invalidate_label_cache(self) -> None:
+        """Discard the cached label maps so the next lookup refetches them."""
+        self._label_map = None
+        self._label_ids_by_name = None
+    
+    def _label_changes(self, action_type: str,
+                       label_name: Optional[str] = None) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """
+        Get the label IDs a label action adds and removes.
+        
+        Args:
+            action_type: One of LABEL_ACTIONS
+            label_name: Target label name for 'move'
+            
+        Returns:
+            (added label IDs, removed label IDs), or None if the target label
+            cannot be found or created
+        """
+        if action_type == 'mark_as_read':
+            return (), ('UNREAD',)
+        if action_type == 'mark_as_unread':
+            return ('UNREAD',), ()
+        if action_type == 'move':
+            label_id = self._get_or_create_label(label_name)
+            if not label_id:
+                return None
+            return (label_id,), ('INBOX',)
+        if action_type == 'archive':
+            return (), ('INBOX',)
+        return None
+    
+    @staticmethod
+    def _modify_body(add_label_ids: Tuple[str, ...],
+                     remove_label_ids: Tuple[str, ...]) -> Dict[str, Any]:
+        """Build a messages.modify/batchModify body, leaving out empty label lists."""
+        body = {}
+        if add_label_ids:
+            body['addLabelIds'] = list(add_label_ids)
+        if remove_label_ids:
+            body['removeLabelIds'] = list(remove_label_ids)
+        return body
+    
+    def _action_request(self, action_type: str, message_id: str,
+                        label_name: Optional[str] = None):
+        """
+        Build the Gmail API request that performs an action on a message.
+        
+        Args:
+            action_type: One of 'mark_as_read', 'mark_as_unread', 'move',
+                'archive' or 'delete'
+            message_id: Gmail message ID
+            label_name: Target label name for 'move'
+            
+        Returns:
+            Unexecuted HttpRequest, or None if the action cannot be built
+        """
+        messages = self.service.users().messages()
+        
+        if action_type == 'delete':
+            return messages.trash(userId='me', id=message_id)
+        if action_type not in LABEL_ACTIONS:
+            logger.warning(f"Unknown action type: {action_type}")
+            return None
+        
+        changes = self._label_changes(action_type, label_name)
+        if changes is None:
+            return None
+        return messages.modify(userId='me', id=message_id, body=self._modify_body(*changes))
+    
+    def execute_actions(self, actions: List[Tuple[str, str, Optional[str]]]) -> List[bool]:
+        """
+        Execute many message actions with as few HTTP requests as possible.
+        
+        Label actions that make the same label change are sent together through
+        messages.batchModify (up to BATCH_MODIFY_LIMIT messages per call); other
+        actions are sent as batch HTTP requests.
+        
+        Actions on the same message keep their order: the Nth action given for
+        each message is sent in the Nth phase, after every earlier phase has
+        completed, so e.g. 'mark_as_read' then 'mark_as_unread' leaves the
+        message unread. Actions on different messages are not ordered.
+        
+        Args:
+            actions: (action_type, message_id, label_name) tuples, see _action_request
+            
+        Returns:
+            Success flag for each action, in the order given
+        """
+        results = [False] * len(actions)
+        
+        # Action indexes by their position among the actions on the same message
+        phases: List[List[int]] = []
+        positions: Dict[str, int] = {}
+        for index, (_, message_id, _) in enumerate(actions):
+            position = positions.get(message_id, 0)
+            positions[message_id] = position + 1
+            if position == len(phases):
+                phases.append([])
+            phases[position].append(index)
+        
+        for indexes in phases:
+            self._execute_action_phase(actions, indexes, results)
+        
+        logger.info(f"Executed {sum(results)} of {len(actions)} actions")
+        return results
+    
+    def _execute_action_phase(self, actions: List[Tuple[str, str, Optional[str]]],
+                              indexes: List[int], results: List[bool]) -> None:
+        """
+        Execute actions on distinct messages, recording which succeeded.
+        
+        Args:
+            actions: (action_type, message_id, label_name) tuples, see _action_request
+            indexes: Indexes into actions to execute, at most one per message
+            results: Success flags for actions, set to True as actions succeed
+        """
+        def on_response(request_id: str, response: Dict[str, Any], exception: Exception) -> None:
+            if exception is not None:
+                logger.error(f"Failed to execute action {actions[int(request_id)]}: {exception}")
+                return
+            results[int(request_id)] = True
+        
+        # Action indexes grouped by (added label IDs, removed label IDs)
+        label_groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[int]] = {}
+        requests = []
+        for index in indexes:
+            action_type, message_id, label_name = actions[index]
+            if action_type in LABEL_ACTIONS:
+                try:
+                    changes = self._label_changes(action_type, label_name)
+                except Exception as error:
+                    # Transport errors looking up or creating a label fail this action only
+                    logger.error(f"Failed to resolve labels for action {actions[index]}: {error}")
+                    continue
+                if changes is not None:
+                    label_groups.setdefault(changes, []).append(index)
+                continue
+            
+            request = self._action_request(action_type, message_id, label_name)
+            if request is not None:
+                requests.append((index, request))
+        
+        messages = self.service.users().messages()
+        for changes, group in label_groups.items():
+            for start in range(0, len(group), BATCH_MODIFY_LIMIT):
+                chunk = group[start:start + BATCH_MODIFY_LIMIT]
+                body = self._modify_body(*changes)
+                body['ids'] = [actions[index][1] for index in chunk]
+                try:
+                    messages.batchModify(userId='me', body=body).execute()
+                except Exception as error:
+                    # Transport errors (timeouts, resets) fail this chunk only
+                    logger.error(f"Failed to modify labels on {len(body['ids'])} messages: {error}")
+                    continue
+                for index in chunk:
+                    results[index] = True
+        
+        for start in range(0, len(requests), BATCH_REQUEST_LIMIT):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for index, request in requests[start:start + BATCH_REQUEST_LIMIT]:
+                batch.add(request, request_id=str(index))
+            try:
+                batch.execute()
+            except Exception as error:
+                logger.error(f"Failed to execute batch of actions: {error}")
+    
     def mark_as_read(self, message_id: str) -> bool:
         """
         Mark email as read.
@@ -265,11 +583,7 @@ class GmailService:
             True if successful, False otherwise
         """
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            self._action_request('mark_as_read', message_id).execute()
             logger.info(f"Marked email {message_id} as read")
             return True
         except HttpError as error:
@@ -287,11 +601,7 @@ class GmailService:
             True if successful, False otherwise
         """
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'addLabelIds': ['UNREAD']}
-            ).execute()
+            self._action_request('mark_as_unread', message_id).execute()
             logger.info(f"Marked email {message_id} as unread")
             return True
         except HttpError as error:
@@ -310,19 +620,11 @@ class GmailService:
             True if successful, False otherwise
         """
         try:
-            # Get or create label
-            label_id = self._get_or_create_label(label_name)
-            if not label_id:
+            request = self._action_request('move', message_id, label_name)
+            if request is None:
                 return False
             
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={
-                    'addLabelIds': [label_id],
-                    'removeLabelIds': ['INBOX']
-                }
-            ).execute()
+            request.execute()
             logger.info(f"Moved email {message_id} to label '{label_name}'")
             return True
             
@@ -341,14 +643,10 @@ class GmailService:
             Label ID if successful, None otherwise
         """
         try:
-            # Get existing labels
-            results = self.service.users().labels().list(userId='me').execute()
-            labels = results.get('labels', [])
-            
             # Check if label exists
-            for label in labels:
-                if label['name'] == label_name:
-                    return label['id']
+            label_id = self._get_label_ids_by_name().get(label_name)
+            if label_id:
+                return label_id
             
             # Create new label
             label_body = {
@@ -362,8 +660,12 @@ class GmailService:
                 body=label_body
             ).execute()
             
+            # Record the new label in both maps instead of refetching them
+            label_id = created_label['id']
+            self._label_map[label_id] = label_name
+            self._label_ids_by_name[label_name] = label_id
             logger.info(f"Created new label: {label_name}")
-            return created_label['id']
+            return label_id
             
         except HttpError as error:
             logger.error(f"Failed to get or create label: {error}")
@@ -380,11 +682,7 @@ class GmailService:
             True if successful, False otherwise
         """
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'removeLabelIds': ['INBOX']}
-            ).execute()
+            self._action_request('archive', message_id).execute()
             logger.info(f"Archived email {message_id}")
             return True
         except HttpError as error:
@@ -402,10 +700,7 @@ class GmailService:
             True if successful, False otherwise
         """
         try:
-            self.service.users().messages().trash(
-                userId='me',
-                id=message_id
-            ).execute()
+            self._action_request('delete', message_id).execute()
             logger.info(f"Deleted email {message_id}")
             return True
         except HttpError as error:
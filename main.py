@@ -4,11 +4,17 @@ Provides CLI commands for fetching emails and applying rules.
 """
 
 import sys
+import json
 import logging
-from typing import Optional
+from typing import Iterable, Optional
 
 import click
-from flask import Flask
+from flask import Flask, Response, stream_with_context
+from sqlalchemy import func, select
+try:
+    import orjson
+except ImportError:  # Optional speedup; the stdlib encoder is used without it
+    orjson = None
 
 from config import config
 from database import db_manager, Email, RuleApplied
@@ -59,7 +65,8 @@ def cli():
 @click.option('--max-results', '-m', type=int, help='Maximum number of emails to fetch')
 @click.option('--query', '-q', default='', help='Gmail search query (e.g., "is:unread")')
 @click.option('--force', '-f', is_flag=True, help='Skip confirmation prompts')
-def fetch(max_results: Optional[int], query: str, force: bool):
+@click.option('--no-body', is_flag=True, help='Fetch headers and labels only, skipping message bodies')
+def fetch(max_results: Optional[int], query: str, force: bool, no_body: bool):
     """Fetch emails from Gmail and store in database."""
     try:
         logger.info("Starting email fetch operation")
@@ -75,28 +82,23 @@ def fetch(max_results: Optional[int], query: str, force: bool):
                 click.echo("Operation cancelled.")
                 return
         
-        # Fetch emails
+        # Fetch emails and save each batch as soon as it arrives
         click.echo("Fetching emails from Gmail...")
-        emails_data = gmail_service.fetch_emails(max_results=max_results, query=query)
+        fetched_count = 0
+        saved_count = 0
+        
+        for emails_data in gmail_service.iter_email_batches(
+            max_results=max_results, query=query, include_body=not no_body
+        ):
+            fetched_count += len(emails_data)
+            saved_count += db_manager.save_emails(emails_data)
+            click.echo(f"   Fetched {fetched_count} emails so far...")
         
-        if not emails_data:
+        if not fetched_count:
             click.echo("No emails found to fetch.")
             return
         
-        click.echo(f"Found {len(emails_data)} emails. Saving to database...")
-        
-        # Save emails to database
-        saved_count = 0
-        skipped_count = 0
-        
-        with click.progressbar(emails_data, label='Saving emails') as emails:
-            for email_data in emails:
-                saved_email = db_manager.save_email(email_data)
-                if saved_email:
-                    if saved_email.created_at == saved_email.updated_at:
-                        saved_count += 1
-                    else:
-                        skipped_count += 1
+        skipped_count = fetched_count - saved_count
         
         click.echo(f"\n✅ Email fetch completed!")
         click.echo(f"   📧 New emails saved: {saved_count}")
@@ -113,8 +115,8 @@ def fetch(max_results: Optional[int], query: str, force: bool):
 
 @cli.command()
 @click.option('--rules', '-r', type=click.Path(exists=True), help='Path to rules JSON file')
-@click.option('--limit', '-l', type=int, help='Limit number of emails to process')
-@click.option('--offset', type=int, default=0, help='Skip this many emails')
+@click.option('--limit', '-l', type=int, help='Only consider the newest N emails')
+@click.option('--offset', type=int, default=0, help='Skip the newest N emails')
 @click.option('--dry-run', '-d', is_flag=True, help='Preview actions without executing them')
 @click.option('--force', '-f', is_flag=True, help='Skip confirmation prompts')
 def apply(rules: Optional[str], limit: Optional[int], offset: int, dry_run: bool, force: bool):
@@ -125,37 +127,56 @@ def apply(rules: Optional[str], limit: Optional[int], offset: int, dry_run: bool
         # Use default rules file if not specified
         rules_file = rules or config.rules_file
         
-        # Get emails from database
-        emails = db_manager.get_emails(limit=limit, offset=offset)
+        # Let the database drop emails the rules cannot match
+        filter_engine = create_rules_engine(None)
+        rules_config = filter_engine.load_rules(rules_file)
+        filter_clause = filter_engine.rules_to_sql_filter(rules_config) if rules_config else None
         
-        if not emails:
+        # Count the selected emails and the candidates the filter leaves of them;
+        # the candidates are streamed from the database below. --limit/--offset
+        # select the newest emails, which the filter then narrows
+        total_count = db_manager.get_email_count(limit=limit, offset=offset)
+        if not total_count:
             click.echo("No emails found in database.")
             click.echo("Run 'python main.py fetch' first to fetch emails.")
             return
         
+        if filter_clause is not None:
+            candidate_count = db_manager.get_email_count(filter_clause, limit=limit, offset=offset)
+        else:
+            candidate_count = total_count
+        
+        if not candidate_count:
+            click.echo("None of the selected emails can match the rules.")
+            return
+        
         # Confirm operation if not forced
         if not force:
-            click.echo(f"About to apply rules from '{rules_file}' to {len(emails)} emails")
+            click.echo(f"About to apply rules from '{rules_file}' to {total_count} emails "
+                       f"({candidate_count} candidates)")
             if dry_run:
                 click.echo("🔍 DRY RUN MODE: No actions will be executed")
             if not click.confirm('Continue?'):
                 click.echo("Operation cancelled.")
                 return
         
+        emails = db_manager.iter_emails(limit=limit, offset=offset, filter_clause=filter_clause)
+        
         if dry_run:
             click.echo("🔍 DRY RUN MODE - Previewing rule matches...")
-            _preview_rules(emails, rules_file)
+            _preview_rules(emails, rules_file, total_count)
         else:
             # Initialize services
             gmail_service = create_gmail_service()
             rules_engine = create_rules_engine(gmail_service)
             
             # Apply rules
-            click.echo(f"Applying rules to {len(emails)} emails...")
+            click.echo(f"Applying rules to {candidate_count} of {total_count} emails...")
             stats = rules_engine.apply_rules_to_emails(emails, rules_file)
             
             click.echo(f"\n✅ Rule application completed!")
-            click.echo(f"   📧 Emails processed: {stats['processed']}")
+            click.echo(f"   📧 Emails selected: {total_count}")
+            click.echo(f"   🔎 Candidates processed: {stats['processed']}")
             click.echo(f"   ✅ Emails matched rules: {stats['matched']}")
             click.echo(f"   ❌ Emails failed processing: {stats['failed']}")
         
@@ -167,8 +188,15 @@ def apply(rules: Optional[str], limit: Optional[int], offset: int, dry_run: bool
         sys.exit(1)
 
 
-def _preview_rules(emails: list[Email], rules_file: str):
-    """Preview which emails would match rules without executing actions."""
+def _preview_rules(emails: Iterable[Email], rules_file: str, total_count: int):
+    """
+    Preview which emails would match rules without executing actions.
+    
+    Args:
+        emails: Candidate emails left by the rules' SQL prefilter
+        rules_file: Path to rules JSON file
+        total_count: Number of selected emails before the prefilter
+    """
     # Create a dummy Gmail service for rule evaluation
     rules_engine = create_rules_engine(None)
     rules_config = rules_engine.load_rules(rules_file)
@@ -177,17 +205,20 @@ def _preview_rules(emails: list[Email], rules_file: str):
         click.echo("❌ Failed to load rules file")
         return
     
+    candidate_count = 0
     matched_count = 0
     
     for email in emails:
+        candidate_count += 1
         if rules_engine.evaluate_email_against_rules(email, rules_config):
             matched_count += 1
             click.echo(f"✅ MATCH: {email.from_address} - {email.subject[:50]}...")
     
     click.echo(f"\n📊 Preview Results:")
-    click.echo(f"   📧 Total emails: {len(emails)}")
+    click.echo(f"   📧 Total emails: {total_count}")
+    click.echo(f"   🔎 Candidates evaluated: {candidate_count}")
     click.echo(f"   ✅ Emails that would match: {matched_count}")
-    click.echo(f"   ⏭️  Emails that would be skipped: {len(emails) - matched_count}")
+    click.echo(f"   ⏭️  Emails that would be skipped: {total_count - matched_count}")
 
 
 @cli.command()
@@ -204,6 +235,8 @@ def list(limit: int):
         click.echo(f"📧 Latest {len(emails)} emails:")
         click.echo("─" * 80)
         
+        rules_by_email = db_manager.get_rules_for_emails([email.id for email in emails])
+        
         for email in emails:
             status = "📖" if email.is_read else "📩"
             received = email.received_at.strftime("%Y-%m-%d %H:%M")
@@ -211,7 +244,7 @@ def list(limit: int):
             click.echo(f"    Subject: {email.subject}")
             
             # Show applied rules if any
-            rules_applied = db_manager.get_rules_for_email(email.id)
+            rules_applied = rules_by_email.get(email.id)
             if rules_applied:
                 rule_names = [rule.rule_name for rule in rules_applied]
                 click.echo(f"    Rules: {', '.join(rule_names)}")
@@ -230,15 +263,15 @@ def list(limit: int):
 def stats():
     """Show database statistics."""
     try:
-        total_emails = db_manager.get_email_count()
+        # Get read/unread counts in one pass
+        with db_manager.get_session() as session:
+            counts = dict(session.execute(
+                select(Email.is_read, func.count()).group_by(Email.is_read)
+            ).all())
         
-        # Get read/unread counts
-        session = db_manager.get_session()
-        try:
-            read_count = session.query(Email).filter_by(is_read=True).count()
-            unread_count = session.query(Email).filter_by(is_read=False).count()
-        finally:
-            session.close()
+        read_count = counts.get(True, 0)
+        unread_count = counts.get(False, 0)
+        total_emails = read_count + unread_count
         
         click.echo("📊 Gmail Rule Engine Statistics")
         click.echo("─" * 40)
@@ -258,20 +291,15 @@ def stats():
 def clear():
     """Clear all emails from database."""
     try:
-        session = db_manager.get_session()
-        try:
+        with db_manager.get_session() as session, session.begin():
             # Delete all rule applications first (foreign key constraint)
-            session.query(RuleApplied).delete()
+            session.query(RuleApplied).delete(synchronize_session=False)
             
             # Delete all emails
-            count = session.query(Email).count()
-            session.query(Email).delete()
-            session.commit()
-            
-            click.echo(f"✅ Cleared {count} emails from database.")
-            
-        finally:
-            session.close()
+            count = session.query(Email).delete(synchronize_session=False)
+        
+        db_manager.clear_email_cache()
+        click.echo(f"✅ Cleared {count} emails from database.")
             
     except Exception as e:
         logger.error(f"Error clearing database: {e}")
@@ -291,14 +319,26 @@ def index():
     }
 
 
+def _json_bytes(data: dict) -> bytes:
+    """Encode data as JSON bytes, using orjson when it is installed."""
+    return orjson.dumps(data) if orjson else json.dumps(data).encode()
+
+
 @app.route('/emails')
 def get_emails():
-    """Get emails as JSON."""
-    emails = db_manager.get_emails(limit=50)
-    return {
-        'emails': [email.to_dict() for email in emails],
-        'total_count': db_manager.get_email_count()
-    }
+    """Get emails as JSON, streamed one email at a time."""
+    emails = db_manager.iter_emails(limit=50)
+    total_count = db_manager.get_email_count()
+    
+    def generate():
+        yield b'{"emails": ['
+        for index, email in enumerate(emails):
+            if index:
+                yield b', '
+            yield _json_bytes(email.to_dict())
+        yield f'], "total_count": {total_count}}}'.encode()
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 def run_web_server(host: str = '127.0.0.1', port: int = 5000, debug: bool = False):
@@ -5,16 +5,107 @@ Supports predicate logic and automated actions on Gmail messages.
 
 import json
 import logging
+import operator
+import os
 import re
-from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Any, Optional, Union
+from functools import lru_cache
+from datetime import datetime, time, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple, Union
 from dateutil import parser as date_parser
+try:
+    import orjson
+except ImportError:  # Optional speedup; the stdlib parser is used without it
+    orjson = None
+try:
+    import re2
+except ImportError:  # Optional linear-time regex engine; re is used without it
+    re2 = None
+from sqlalchemy import and_, func, or_
+from sqlalchemy.sql import ColumnElement
 
 from database import Email, db_manager
 from gmail_service import GmailService
 
 logger = logging.getLogger(__name__)
 
+# Email columns that string rules can be translated to SQL against
+SQL_STRING_COLUMNS = {
+    'from': Email.from_address,
+    'to': Email.to_address,
+    'subject': Email.subject,
+    'body': Email.body,
+    'message': Email.body,
+}
+
+# Slack added to date bounds in SQL prefilters, covering any timezone offset
+SQL_DATE_MARGIN = timedelta(days=1)
+
+# Key in a matcher's lowered_fields context holding the current time pinned for
+# a pass, as (timezone-aware, naive local); see _pin_clock
+PINNED_NOW_KEY = '_now'
+
+
+def _body_text(email: Email) -> str:
+    """Email body, empty if missing."""
+    return email.body or ''
+
+
+def _labels_text(email: Email) -> str:
+    """Email labels as one comma-separated string."""
+    labels = email.labels or ''
+    if isinstance(labels, list):
+        labels = ', '.join(labels)
+    return labels
+
+
+# Rule field name -> function reading that field from an email
+EMAIL_FIELD_GETTERS = {
+    'from': operator.attrgetter('from_address'),
+    'to': operator.attrgetter('to_address'),
+    'subject': operator.attrgetter('subject'),
+    'body': _body_text,
+    'message': _body_text,
+    'labels': _labels_text,
+    'received_date': operator.attrgetter('received_at'),
+    'received_at': operator.attrgetter('received_at'),
+}
+
+
+@lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> Optional[Any]:
+    """
+    Compile a rule regex once; invalid patterns are reported once and return None.
+    
+    Patterns are compiled with re2 when it is installed, so a pathological
+    pattern in a rules file cannot backtrack exponentially. Patterns re2 does
+    not support (e.g. backreferences) fall back to re.
+    """
+    if re2 is not None:
+        try:
+            return re2.compile('(?i)' + pattern)
+        except Exception:
+            pass
+    
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        logger.warning(f"Invalid regex pattern: {pattern}")
+        return None
+
+
+def _rule_cost(rule: Dict[str, Any]) -> int:
+    """Rough relative cost of evaluating a rule, used to try cheap rules first."""
+    predicate = str(rule.get('predicate', '')).lower()
+    field = str(rule.get('field', '')).lower()
+    
+    if predicate == 'matches':
+        return 3
+    if field in ('received_date', 'received_at'):
+        return 2
+    if field in ('body', 'message'):
+        return 1
+    return 0
+
 
 class RulesPredicate:
     """Predicate evaluation for email field matching."""
@@ -52,47 +143,51 @@ class RulesPredicate:
     @staticmethod
     def regex_match(field_value: str, pattern: str) -> bool:
         """Check if field matches regex pattern."""
-        try:
-            return bool(re.search(pattern, field_value, re.IGNORECASE))
-        except re.error:
-            logger.warning(f"Invalid regex pattern: {pattern}")
-            return False
+        compiled = _compile_pattern(pattern)
+        return compiled is not None and compiled.search(field_value) is not None
+
+
+def _as_datetime(value: Union[str, datetime]) -> datetime:
+    """Return value as a datetime, parsing it if it is still a string."""
+    return value if isinstance(value, datetime) else date_parser.parse(value)
 
 
 class DatePredicate:
     """Date-specific predicate evaluation."""
     
     @staticmethod
-    def less_than_days_ago(received_at: datetime, days: int) -> bool:
-        """Check if email was received less than N days ago."""
-        # Ensure timezone consistency
-        now = datetime.now(timezone.utc) if received_at.tzinfo else datetime.now()
-        cutoff_date = now - timedelta(days=days)
-        return received_at > cutoff_date
+    def _days_ago(received_at: datetime, days: int, now: Optional[datetime]) -> datetime:
+        """Cutoff N days before now, which defaults to the clock read like received_at."""
+        if now is None:
+            # Ensure timezone consistency
+            now = datetime.now(timezone.utc) if received_at.tzinfo else datetime.now()
+        return now - timedelta(days=days)
+    
+    @staticmethod
+    def less_than_days_ago(received_at: datetime, days: int, now: Optional[datetime] = None) -> bool:
+        """Check if email was received less than N days before now (default: the clock)."""
+        return received_at > DatePredicate._days_ago(received_at, days, now)
     
     @staticmethod
-    def greater_than_days_ago(received_at: datetime, days: int) -> bool:
-        """Check if email was received more than N days ago."""
-        # Ensure timezone consistency
-        now = datetime.now(timezone.utc) if received_at.tzinfo else datetime.now()
-        cutoff_date = now - timedelta(days=days)
-        return received_at < cutoff_date
+    def greater_than_days_ago(received_at: datetime, days: int, now: Optional[datetime] = None) -> bool:
+        """Check if email was received more than N days before now (default: the clock)."""
+        return received_at < DatePredicate._days_ago(received_at, days, now)
     
     @staticmethod
-    def equals_date(received_at: datetime, date_str: str) -> bool:
+    def equals_date(received_at: datetime, date_str: Union[str, datetime]) -> bool:
         """Check if email was received on specific date."""
         try:
-            target_date = date_parser.parse(date_str).date()
+            target_date = _as_datetime(date_str).date()
             return received_at.date() == target_date
         except Exception:
             logger.warning(f"Invalid date format: {date_str}")
             return False
     
     @staticmethod
-    def before_date(received_at: datetime, date_str: str) -> bool:
+    def before_date(received_at: datetime, date_str: Union[str, datetime]) -> bool:
         """Check if email was received before specific date."""
         try:
-            target_date = date_parser.parse(date_str)
+            target_date = _as_datetime(date_str)
             # Ensure timezone consistency
             if received_at.tzinfo and not target_date.tzinfo:
                 target_date = target_date.replace(tzinfo=timezone.utc)
@@ -104,10 +199,10 @@ class DatePredicate:
             return False
     
     @staticmethod
-    def after_date(received_at: datetime, date_str: str) -> bool:
+    def after_date(received_at: datetime, date_str: Union[str, datetime]) -> bool:
         """Check if email was received after specific date."""
         try:
-            target_date = date_parser.parse(date_str)
+            target_date = _as_datetime(date_str)
             # Ensure timezone consistency
             if received_at.tzinfo and not target_date.tzinfo:
                 target_date = target_date.replace(tzinfo=timezone.utc)
@@ -119,135 +214,233 @@ class DatePredicate:
             return False
 
 
-class RuleEvaluator:
-    """Evaluates individual rules against emails."""
+def _parse_date_value(rule: Dict[str, Any]) -> Optional[Union[int, datetime]]:
+    """
+    Convert a date rule's value to the form its predicate compares against.
     
-    def __init__(self):
-        """Initialize rule evaluator."""
-        self.string_predicates = {
-            'contains': RulesPredicate.contains,
-            'equals': RulesPredicate.equals,
-            'does not equal': RulesPredicate.does_not_equal,
-            'does not contain': RulesPredicate.does_not_contain,
-            'starts with': RulesPredicate.starts_with,
-            'ends with': RulesPredicate.ends_with,
-            'matches': RulesPredicate.regex_match,
-        }
+    Args:
+        rule: Rule dictionary on a date field
         
-        self.date_predicates = {
-            'less than': DatePredicate.less_than_days_ago,
-            'greater than': DatePredicate.greater_than_days_ago,
-            'equals': DatePredicate.equals_date,
-            'before': DatePredicate.before_date,
-            'after': DatePredicate.after_date,
-        }
+    Returns:
+        Number of days for 'less than'/'greater than', a datetime for the
+        other predicates, or None if the value cannot be parsed
+    """
+    predicate = str(rule.get('predicate', '')).lower()
+    value = rule.get('value', '')
     
-    def evaluate_rule(self, rule: Dict[str, Any], email: Email) -> bool:
-        """
-        Evaluate a single rule against an email.
-        
-        Args:
-            rule: Rule dictionary with field, predicate, and value
-            email: Email object to evaluate
-            
-        Returns:
-            True if rule matches, False otherwise
-        """
-        field = rule.get('field', '').lower()
-        predicate = rule.get('predicate', '').lower()
-        value = rule.get('value', '')
-        
-        # Get field value from email
-        field_value = self._get_email_field_value(email, field)
-        if field_value is None:
-            return False
-        
-        # Handle date fields
-        if field == 'received_date' or field == 'received_at':
-            return self._evaluate_date_predicate(email.received_at, predicate, value)
+    try:
+        if predicate in ('less than', 'greater than'):
+            return int(value)
+        return date_parser.parse(value)
+    except (ValueError, TypeError, OverflowError):
+        logger.warning(f"Invalid date value in rule: {value}")
+        return None
+
+
+# Case-insensitive string predicates applied to already-lowercased values
+LOWERED_STRING_PREDICATES = {
+    'contains': operator.contains,
+    'equals': operator.eq,
+    'does not equal': operator.ne,
+    'does not contain': lambda field_value, test_value: test_value not in field_value,
+    'starts with': str.startswith,
+    'ends with': str.endswith,
+}
+
+DATE_PREDICATES = {
+    'less than': DatePredicate.less_than_days_ago,
+    'greater than': DatePredicate.greater_than_days_ago,
+    'equals': DatePredicate.equals_date,
+    'before': DatePredicate.before_date,
+    'after': DatePredicate.after_date,
+}
+
+
+def compile_rule(rule: Dict[str, Any]) -> Optional[Callable[..., bool]]:
+    """
+    Build a function that evaluates one rule against an email.
+    
+    The field getter, predicate function and preprocessed test value are bound
+    once, so evaluating the rule skips per-email dictionary lookups and
+    dispatch. The function is called as matcher(email, lowered_fields), where
+    the optional lowered_fields dict is shared by the rules evaluated against
+    one email so each field is lowercased once. Relative date rules compare
+    against the time under its PINNED_NOW_KEY, or the clock if it is absent.
+    
+    Args:
+        rule: Rule dictionary, usually after RulesEngine._prepare_rules has
+            parsed its date value
         
-        # Handle string fields
-        return self._evaluate_string_predicate(field_value, predicate, value)
+    Returns:
+        Function returning whether an email matches, or None if the rule
+        cannot match anything (unknown field or predicate, bad value)
+    """
+    field = str(rule.get('field', '')).lower()
+    predicate = str(rule.get('predicate', '')).lower()
+    value = rule.get('value', '')
+    getter = EMAIL_FIELD_GETTERS.get(field)
+    if getter is None:
+        return None
     
-    def _get_email_field_value(self, email: Email, field: str) -> Optional[str]:
-        """
-        Get field value from email object.
+    if field in ('received_date', 'received_at'):
+        date_predicate = DATE_PREDICATES.get(predicate)
+        date_value = rule['_date_value'] if '_date_value' in rule else _parse_date_value(rule)
+        if date_predicate is None or date_value is None:
+            return None
         
-        Args:
-            email: Email object
-            field: Field name
+        if predicate in ('less than', 'greater than'):
+            try:
+                timedelta(days=date_value)
+            except OverflowError:
+                return None
             
-        Returns:
-            Field value as string, None if field not found
-        """
-        field_mapping = {
-            'from': email.from_address,
-            'to': email.to_address,
-            'subject': email.subject,
-            'body': email.body or '',
-            'message': email.body or '',
-            'labels': email.labels or '',
-            'received_date': email.received_at,
-            'received_at': email.received_at,
-        }
+            def match_age(email: Email, lowered_fields: Optional[Dict[str, Any]] = None) -> bool:
+                received_at = email.received_at
+                if received_at is None:
+                    return False
+                pinned = lowered_fields.get(PINNED_NOW_KEY) if lowered_fields is not None else None
+                now = None
+                if pinned is not None:
+                    now = pinned[0] if received_at.tzinfo else pinned[1]
+                return date_predicate(received_at, date_value, now)
+            return match_age
         
-        return field_mapping.get(field)
+        def match_date(email: Email, lowered_fields: Optional[Dict[str, str]] = None) -> bool:
+            received_at = email.received_at
+            if received_at is None:
+                return False
+            try:
+                return date_predicate(received_at, date_value)
+            except Exception as e:
+                logger.error(f"Error evaluating date predicate: {e}")
+                return False
+        return match_date
     
-    def _evaluate_string_predicate(self, field_value: str, predicate: str, test_value: str) -> bool:
-        """
-        Evaluate string predicate.
-        
-        Args:
-            field_value: Value from email field
-            predicate: Predicate type
-            test_value: Value to test against
-            
-        Returns:
-            True if predicate matches, False otherwise
-        """
-        predicate_func = self.string_predicates.get(predicate)
-        if not predicate_func:
-            logger.warning(f"Unknown string predicate: {predicate}")
-            return False
+    if not isinstance(value, str):
+        return None
+    
+    if predicate == 'matches':
+        pattern = _compile_pattern(value)
+        if pattern is None:
+            return lambda email, lowered_fields=None: False
+        search = pattern.search
         
+        def match_pattern(email: Email, lowered_fields: Optional[Dict[str, str]] = None) -> bool:
+            field_value = getter(email)
+            return field_value is not None and search(field_value) is not None
+        return match_pattern
+    
+    lowered_predicate = LOWERED_STRING_PREDICATES.get(predicate)
+    if lowered_predicate is None:
+        return None
+    test_value = value.lower()
+    
+    def match_string(email: Email, lowered_fields: Optional[Dict[str, str]] = None) -> bool:
+        lowered_value = lowered_fields.get(field) if lowered_fields is not None else None
+        if lowered_value is None:
+            field_value = getter(email)
+            if field_value is None:
+                return False
+            lowered_value = field_value.lower()
+            if lowered_fields is not None:
+                lowered_fields[field] = lowered_value
         try:
-            return predicate_func(field_value, test_value)
+            return lowered_predicate(lowered_value, test_value)
         except Exception as e:
             logger.error(f"Error evaluating string predicate: {e}")
             return False
+    return match_string
+
+
+def _pin_clock(now: datetime) -> Tuple[datetime, datetime]:
+    """
+    Pin the current time for a pass over many emails.
+    
+    Args:
+        now: Timezone-aware current time
+        
+    Returns:
+        The time as (timezone-aware, naive local), for aware and naive
+        received_at values respectively
+    """
+    return now, now.astimezone().replace(tzinfo=None)
+
+
+def _never_matches(email: Email, lowered_fields: Optional[Dict[str, str]] = None) -> bool:
+    """Matcher for rules that compile_rule cannot compile."""
+    return False
+
+
+def _rule_matcher(rule: Dict[str, Any]) -> Callable[..., bool]:
+    """
+    Compile a rule, falling back to a matcher that never matches.
+    
+    Args:
+        rule: Rule dictionary
+        
+    Returns:
+        Matcher function, see compile_rule
+    """
+    matcher = compile_rule(rule)
+    if matcher is None:
+        logger.warning(f"Unsupported rule, it will never match: {rule}")
+        return _never_matches
+    return matcher
+
+
+class RuleEvaluator:
+    """Evaluates individual rules against emails."""
+    
+    def __init__(self):
+        """Initialize rule evaluator."""
+        # Results keyed by (field, predicate, value, email) while enabled, so
+        # identical rules in different rule sets are evaluated once per email.
+        # Emails hash by identity; Email.id is None for every unsaved email.
+        self.result_cache: Optional[Dict[Tuple[Any, ...], bool]] = None
     
-    def _evaluate_date_predicate(self, received_at: datetime, predicate: str, value: str) -> bool:
+    def evaluate_rule(self, rule: Dict[str, Any], email: Email,
+                      lowered_fields: Optional[Dict[str, str]] = None) -> bool:
         """
-        Evaluate date predicate.
+        Evaluate a single rule against an email, reusing cached results if enabled.
+        
+        Prepared rules are evaluated with their bound '_matcher'; other rule
+        dictionaries are compiled first (see compile_rule).
         
         Args:
-            received_at: Email received datetime
-            predicate: Predicate type
-            value: Value to test against
+            rule: Rule dictionary with field, predicate, and value
+            email: Email object to evaluate
+            lowered_fields: Lowercased field values of this email, filled in as
+                fields are read so that rules sharing a field lowercase it once
             
         Returns:
-            True if predicate matches, False otherwise
+            True if rule matches, False otherwise
         """
-        predicate_func = self.date_predicates.get(predicate)
-        if not predicate_func:
-            logger.warning(f"Unknown date predicate: {predicate}")
-            return False
+        matcher = rule.get('_matcher') or _rule_matcher(rule)
+        if self.result_cache is None:
+            return matcher(email, lowered_fields)
         
+        key = (
+            str(rule.get('field', '')).lower(),
+            str(rule.get('predicate', '')).lower(),
+            rule.get('value', ''),
+            email
+        )
         try:
-            # Handle numeric values for days
-            if predicate in ['less than', 'greater than']:
-                days = int(value)
-                return predicate_func(received_at, days)
-            else:
-                return predicate_func(received_at, value)
-        except Exception as e:
-            logger.error(f"Error evaluating date predicate: {e}")
-            return False
+            return self.result_cache[key]
+        except KeyError:
+            result = self.result_cache[key] = matcher(email, lowered_fields)
+            return result
+        except TypeError:
+            # Unhashable rule value
+            return matcher(email, lowered_fields)
 
 
 class RuleAction:
     """Execute actions on emails based on rules."""
     
+    # Alternate spellings accepted in rules files
+    ACTION_ALIASES = {'mark_read': 'mark_as_read', 'mark_unread': 'mark_as_unread'}
+    
     def __init__(self, gmail_service: GmailService):
         """
         Initialize rule actions.
@@ -256,6 +449,21 @@ class RuleAction:
             gmail_service: Gmail service instance
         """
         self.gmail_service = gmail_service
+        self._pending: List[Tuple[str, Email, str, Optional[str]]] = []
+    
+    def _parse_action(self, action: str) -> Tuple[str, Optional[str]]:
+        """
+        Split an action string into its normalized type and parameter.
+        
+        Args:
+            action: Action string (e.g., 'mark_as_read', 'move:Important')
+            
+        Returns:
+            Tuple of (action type, parameter or None)
+        """
+        action_type, _, parameter = action.strip().partition(':')
+        action_type = action_type.lower()
+        return self.ACTION_ALIASES.get(action_type, action_type), parameter.strip() or None
     
     def execute_action(self, action: str, email: Email) -> bool:
         """
@@ -271,23 +479,21 @@ class RuleAction:
         action = action.strip()
         
         try:
-            # Normalize action type but preserve parameters
-            action_type = action.split(':')[0].lower() if ':' in action else action.lower()
+            action_type, label_name = self._parse_action(action)
             
-            if action_type == 'mark_as_read' or action_type == 'mark_read':
+            if action_type == 'mark_as_read':
                 success = self.gmail_service.mark_as_read(email.gmail_id)
                 if success:
                     db_manager.update_email_status(email.id, is_read=True)
                 return success
             
-            elif action_type == 'mark_as_unread' or action_type == 'mark_unread':
+            elif action_type == 'mark_as_unread':
                 success = self.gmail_service.mark_as_unread(email.gmail_id)
                 if success:
                     db_manager.update_email_status(email.id, is_read=False)
                 return success
             
             elif action_type == 'move':
-                label_name = action.split(':', 1)[1].strip()
                 return self.gmail_service.move_to_label(email.gmail_id, label_name)
             
             elif action_type == 'archive':
@@ -303,11 +509,106 @@ class RuleAction:
         except Exception as e:
             logger.error(f"Error executing action '{action}': {e}")
             return False
+    
+    def queue_action(self, action: str, email: Email) -> bool:
+        """
+        Queue an action to be executed by the next flush().
+        
+        Args:
+            action: Action string (e.g., 'mark_as_read', 'move:Important')
+            email: Email object
+            
+        Returns:
+            True if the action was queued, False if it is unknown or malformed
+        """
+        entry = self._pending_entry(action, email)
+        if entry is None:
+            return False
+        self._pending.append(entry)
+        return True
+    
+    def queue_actions(self, actions: List[str], email: Email) -> List[bool]:
+        """
+        Queue all of an email's actions to be executed by the next flush().
+        
+        Nothing is queued if any action raises (e.g. it is not a string), so
+        the results of flush() stay aligned with the emails whose actions were
+        queued.
+        
+        Args:
+            actions: Action strings
+            email: Email object
+            
+        Returns:
+            Whether each action was queued, see queue_action
+        """
+        entries = [self._pending_entry(action, email) for action in actions]
+        self._pending.extend(entry for entry in entries if entry is not None)
+        return [entry is not None for entry in entries]
+    
+    def _pending_entry(self, action: str, email: Email) -> Optional[Tuple[str, Email, str, Optional[str]]]:
+        """
+        Build the queue entry for an action.
+        
+        Args:
+            action: Action string
+            email: Email object
+            
+        Returns:
+            Entry of (action, email, action type, parameter), or None if the
+            action is unknown or malformed
+        """
+        action_type, label_name = self._parse_action(action)
+        
+        if action_type not in ('mark_as_read', 'mark_as_unread', 'move', 'archive', 'delete'):
+            logger.warning(f"Unknown action: {action}")
+            return None
+        if action_type == 'move' and not label_name:
+            logger.warning(f"Missing label for action: {action}")
+            return None
+        
+        return action, email, action_type, label_name
+    
+    def flush(self) -> List[bool]:
+        """
+        Execute all queued actions with batched Gmail requests.
+        
+        Read status changes that succeed are written to the database in a
+        single transaction per status.
+        
+        Returns:
+            Success flag for each queued action, in the order they were queued
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return []
+        
+        success_flags = self.gmail_service.execute_actions([
+            (action_type, email.gmail_id, label_name)
+            for _, email, action_type, label_name in pending
+        ])
+        
+        read_status = {}
+        for (_, email, action_type, _), success in zip(pending, success_flags):
+            # Emails that were never saved have no row to update
+            if success and action_type in ('mark_as_read', 'mark_as_unread') and email.id is not None:
+                read_status[email.id] = action_type == 'mark_as_read'
+        
+        for is_read in (True, False):
+            email_ids = [email_id for email_id, status in read_status.items() if status == is_read]
+            db_manager.update_emails_status(email_ids, is_read=is_read)
+        
+        return list(success_flags)
 
 
 class RulesEngine:
     """Main rules engine for processing emails."""
     
+    # Parsed rules by absolute path, with the file version they were read at.
+    # Shared by all engines, so a rules file loaded by one (e.g. to build the
+    # SQL prefilter) is not parsed again by the next.
+    _rules_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+    
     def __init__(self, gmail_service: GmailService):
         """
         Initialize rules engine.
@@ -323,6 +624,10 @@ class RulesEngine:
         """
         Load rules from JSON file.
         
+        Parsed rules are cached for all engines until the file's modification
+        time or size changes, so the returned dictionary is shared between
+        calls and must not be modified.
+        
         Args:
             rules_file: Path to rules JSON file
             
@@ -330,42 +635,204 @@ class RulesEngine:
             Rules dictionary if loaded successfully, None otherwise
         """
         try:
-            with open(rules_file, 'r') as f:
-                rules = json.load(f)
+            file_stat = os.stat(rules_file)
+            cache_key = os.path.abspath(rules_file)
+            version = (file_stat.st_mtime_ns, file_stat.st_size)
+            
+            cached = self._rules_cache.get(cache_key)
+            if cached and cached[0] == version:
+                return cached[1]
+            
+            with open(rules_file, 'rb') as f:
+                data = f.read()
+            rules = self.parse_rules(data)
+            if rules is None:
+                return None
+            
+            self._rules_cache[cache_key] = (version, rules)
+            
             logger.info(f"Loaded rules from {rules_file}")
             return rules
         except FileNotFoundError:
             logger.error(f"Rules file not found: {rules_file}")
             return None
+        except Exception as e:
+            logger.error(f"Error loading rules file: {e}")
+            return None
+    
+    def parse_rules(self, data: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+        """
+        Parse and prepare rules from a JSON document already in memory.
+        
+        Unlike load_rules, the result is not cached.
+        
+        Args:
+            data: Rules JSON as text or bytes
+            
+        Returns:
+            Rules dictionary if parsed successfully, None otherwise
+        """
+        try:
+            rules = orjson.loads(data) if orjson else json.loads(data)
+            self._prepare_rules(rules)
+            return rules
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON in rules file: {e}")
             return None
         except Exception as e:
-            logger.error(f"Error loading rules file: {e}")
+            logger.error(f"Error parsing rules: {e}")
+            return None
+    
+    def _prepare_rules(self, rules_config: Dict[str, Any]) -> None:
+        """
+        Precompute per-rule values that are constant across emails.
+        
+        Parses date values into '_date_value' (None if invalid), binds each
+        rule into a '_matcher' function (see compile_rule) so invalid rules are
+        reported at load time, and stores the rules ordered cheapest first in
+        '_rules_sorted' with their matchers in the same order in '_matchers'.
+        
+        Args:
+            rules_config: Rules configuration dictionary, updated in place
+        """
+        rules = rules_config.get('rules', [])
+        for rule in rules:
+            if str(rule.get('field', '')).lower() in ('received_date', 'received_at'):
+                rule['_date_value'] = _parse_date_value(rule)
+            rule['_matcher'] = _rule_matcher(rule)
+        
+        rules_config['_rules_sorted'] = sorted(rules, key=_rule_cost)
+        rules_config['_matchers'] = [rule['_matcher'] for rule in rules_config['_rules_sorted']]
+    
+    def rules_to_sql_filter(self, rules_config: Dict[str, Any]) -> Optional[ColumnElement]:
+        """
+        Translate a rule set into a SQL WHERE clause that preselects candidate emails.
+        
+        The clause only narrows what is loaded from the database; candidates are
+        still evaluated in Python, so it may admit emails that do not match but
+        never excludes one that does. Rules that cannot be expressed in SQL
+        (regexes, labels, non-ASCII text) are left out of ALL rule sets, and an
+        ANY rule set is only translated when every rule can be.
+        
+        Args:
+            rules_config: Rules configuration dictionary
+            
+        Returns:
+            WHERE clause, or None if the rules cannot narrow the emails
+        """
+        predicate = rules_config.get('predicate', 'ALL').upper()
+        clauses = [self._rule_to_sql(rule) for rule in rules_config.get('rules', [])]
+        
+        if predicate == 'ANY' or predicate == 'OR':
+            if not clauses or any(clause is None for clause in clauses):
+                return None
+            return or_(*clauses)
+        
+        clauses = [clause for clause in clauses if clause is not None]
+        return and_(*clauses) if clauses else None
+    
+    def _rule_to_sql(self, rule: Dict[str, Any]) -> Optional[ColumnElement]:
+        """
+        Translate a single rule into a SQL condition.
+        
+        Args:
+            rule: Rule dictionary with field, predicate, and value
+            
+        Returns:
+            SQL condition, or None if the rule has no SQL equivalent
+        """
+        field = str(rule.get('field', '')).lower()
+        predicate = str(rule.get('predicate', '')).lower()
+        value = rule.get('value', '')
+        
+        if field in ('received_date', 'received_at'):
+            return self._date_rule_to_sql(rule, predicate)
+        
+        column = SQL_STRING_COLUMNS.get(field)
+        # SQL lower() only folds ASCII reliably across databases
+        if column is None or not isinstance(value, str) or not value.isascii():
+            return None
+        
+        lowered_column = func.lower(func.coalesce(column, ''))
+        lowered_value = value.lower()
+        
+        if predicate == 'contains':
+            return lowered_column.contains(lowered_value, autoescape=True)
+        if predicate == 'does not contain':
+            return ~lowered_column.contains(lowered_value, autoescape=True)
+        if predicate == 'equals':
+            return lowered_column == lowered_value
+        if predicate == 'does not equal':
+            return lowered_column != lowered_value
+        if predicate == 'starts with':
+            return lowered_column.startswith(lowered_value, autoescape=True)
+        if predicate == 'ends with':
+            return lowered_column.endswith(lowered_value, autoescape=True)
+        return None
+    
+    def _date_rule_to_sql(self, rule: Dict[str, Any], predicate: str) -> Optional[ColumnElement]:
+        """
+        Translate a date rule into a received_at range widened by SQL_DATE_MARGIN.
+        
+        Args:
+            rule: Rule dictionary on a date field
+            predicate: Lowercased rule predicate
+            
+        Returns:
+            SQL condition, or None if the rule has no SQL equivalent
+        """
+        if predicate not in ('less than', 'greater than', 'before', 'after', 'equals'):
+            return None
+        
+        value = rule['_date_value'] if '_date_value' in rule else _parse_date_value(rule)
+        if value is None:
             return None
+        
+        if predicate in ('less than', 'greater than'):
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=value)
+            if predicate == 'less than':
+                return Email.received_at > cutoff - SQL_DATE_MARGIN
+            return Email.received_at < cutoff + SQL_DATE_MARGIN
+        
+        # Stored timestamps are naive UTC
+        if value.tzinfo:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        if predicate == 'before':
+            return Email.received_at < value + SQL_DATE_MARGIN
+        if predicate == 'after':
+            return Email.received_at > value - SQL_DATE_MARGIN
+        day_start = datetime.combine(value.date(), time())
+        return Email.received_at.between(day_start - SQL_DATE_MARGIN,
+                                         day_start + timedelta(days=1) + SQL_DATE_MARGIN)
     
-    def evaluate_email_against_rules(self, email: Email, rules_config: Dict[str, Any]) -> bool:
+    def evaluate_email_against_rules(self, email: Email, rules_config: Dict[str, Any],
+                                     pinned_now: Optional[Tuple[datetime, datetime]] = None) -> bool:
         """
         Evaluate if an email matches the rule set.
         
+        Evaluation stops at the first rule that decides the result.
+        
         Args:
             email: Email object to evaluate
             rules_config: Rules configuration dictionary
+            pinned_now: Time relative date rules compare against, from
+                _pin_clock; the clock is read per evaluation if None
             
         Returns:
             True if email matches rules, False otherwise
         """
         predicate = rules_config.get('predicate', 'ALL').upper()
-        rules = rules_config.get('rules', [])
+        rules = rules_config.get('_rules_sorted') or rules_config.get('rules', [])
         
         if not rules:
             return False
         
-        rule_results = []
-        for rule in rules:
-            result = self.evaluator.evaluate_rule(rule, email)
-            rule_results.append(result)
-            logger.debug(f"Rule evaluation: {rule} -> {result}")
+        matchers = rules_config.get('_matchers')
+        if matchers is None:
+            # Rule sets that did not go through load_rules or parse_rules
+            matchers = [rule.get('_matcher') or _rule_matcher(rule) for rule in rules]
+        rule_results = self._iter_rule_results(rules, matchers, email, pinned_now)
         
         # Apply predicate logic
         if predicate == 'ALL' or predicate == 'AND':
@@ -376,13 +843,47 @@ class RulesEngine:
             logger.warning(f"Unknown predicate: {predicate}, defaulting to ALL")
             return all(rule_results)
     
-    def apply_rules_to_email(self, email: Email, rules_config: Dict[str, Any]) -> bool:
+    def _iter_rule_results(self, rules: List[Dict[str, Any]], matchers: List[Callable[..., bool]],
+                           email: Email, pinned_now: Optional[Tuple[datetime, datetime]] = None
+                           ) -> Iterator[bool]:
+        """
+        Lazily evaluate rules against an email, one result per rule.
+        
+        Each rule's matcher is called directly unless the evaluator's result
+        cache is enabled. Rules on the same field share its lowercased value.
+        
+        Args:
+            rules: Rule dictionaries
+            matchers: Compiled matcher of each rule, in the same order
+            email: Email object to evaluate
+            pinned_now: Time relative date rules compare against, see _pin_clock
+            
+        Yields:
+            Whether each rule matches
+        """
+        lowered_fields = {PINNED_NOW_KEY: pinned_now} if pinned_now is not None else {}
+        cached = self.evaluator.result_cache is not None
+        # Checked once per email; formatting rule dicts is costly in this loop
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        for rule, matcher in zip(rules, matchers):
+            if cached:
+                result = self.evaluator.evaluate_rule(rule, email, lowered_fields)
+            else:
+                result = matcher(email, lowered_fields)
+            if debug_enabled:
+                logger.debug("Rule evaluation: %s -> %s", rule, result)
+            yield result
+    
+    def apply_rules_to_email(self, email: Email, rules_config: Dict[str, Any],
+                             applied_log: Optional[List[Dict[str, Any]]] = None) -> bool:
         """
         Apply rules to a single email.
         
         Args:
             email: Email object
             rules_config: Rules configuration dictionary
+            applied_log: If given, rule applications are appended here for the
+                caller to log in bulk instead of being written immediately
             
         Returns:
             True if rules were applied, False otherwise
@@ -404,29 +905,58 @@ class RulesEngine:
             else:
                 logger.error(f"Failed to execute action: {action}")
         
-        # Log rule application
-        if successful_actions:
-            rule_id = rules_config.get('id', 'unnamed_rule')
-            rule_name = rules_config.get('name', f'Rule {rule_id}')
+        return self._record_rule_application(email, rules_config, successful_actions, applied_log)
+    
+    def _record_rule_application(self, email: Email, rules_config: Dict[str, Any],
+                                 successful_actions: List[str],
+                                 applied_log: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Log the actions a rule set successfully applied to an email.
+        
+        Args:
+            email: Email object
+            rules_config: Rules configuration dictionary
+            successful_actions: Actions that succeeded on the email
+            applied_log: If given, the application is appended here instead of
+                being written immediately
             
+        Returns:
+            True if any action succeeded, False otherwise
+        """
+        if not successful_actions:
+            return False
+        
+        rule_id = rules_config.get('id', 'unnamed_rule')
+        rule_name = rules_config.get('name', f'Rule {rule_id}')
+        
+        if applied_log is not None:
+            applied_log.append({
+                'email_id': email.id,
+                'rule_id': rule_id,
+                'rule_name': rule_name,
+                'actions': successful_actions
+            })
+        else:
             db_manager.log_rule_applied(
                 email_id=email.id,
                 rule_id=rule_id,
                 rule_name=rule_name,
                 actions=successful_actions
             )
-            
-            logger.info(f"Applied rule '{rule_name}' to email {email.id}")
-            return True
         
-        return False
+        logger.info(f"Applied rule '{rule_name}' to email {email.id}")
+        return True
     
-    def apply_rules_to_emails(self, emails: List[Email], rules_file: str) -> Dict[str, int]:
+    def apply_rules_to_emails(self, emails: Iterable[Email], rules_file: str) -> Dict[str, int]:
         """
         Apply rules to multiple emails.
         
+        All emails are matched first and their actions queued, then the actions
+        are sent to Gmail in batches. The emails are iterated once, so a
+        streaming iterator such as DatabaseManager.iter_emails() can be passed.
+        
         Args:
-            emails: List of email objects
+            emails: Email objects
             rules_file: Path to rules JSON file
             
         Returns:
@@ -437,16 +967,43 @@ class RulesEngine:
             return {'processed': 0, 'matched': 0, 'failed': 0}
         
         stats = {'processed': 0, 'matched': 0, 'failed': 0}
+        actions = rules_config.get('actions', [])
+        matched_emails = []
+        applied_log = []
         
+        # Relative date rules compare against one clock reading for the whole pass
+        pinned_now = _pin_clock(datetime.now(timezone.utc))
         for email in emails:
             try:
                 stats['processed'] += 1
-                if self.apply_rules_to_email(email, rules_config):
-                    stats['matched'] += 1
+                if self.evaluate_email_against_rules(email, rules_config, pinned_now):
+                    queued = self.action_executor.queue_actions(actions, email)
+                    matched_emails.append((email, queued))
             except Exception as e:
                 logger.error(f"Error processing email {email.id}: {e}")
                 stats['failed'] += 1
         
+        if matched_emails and not actions:
+            logger.warning("No actions specified in rules")
+        
+        try:
+            # Results come back in queue order: per matched email, per queued action
+            results = iter(self.action_executor.flush())
+            
+            for email, queued in matched_emails:
+                successful_actions = []
+                for action, was_queued in zip(actions, queued):
+                    if was_queued and next(results):
+                        successful_actions.append(action)
+                    else:
+                        logger.error(f"Failed to execute action: {action}")
+                
+                if self._record_rule_application(email, rules_config, successful_actions, applied_log):
+                    stats['matched'] += 1
+        finally:
+            # Record every rule application in one transaction, even if interrupted
+            db_manager.log_rules_applied(applied_log)
+        
         logger.info(f"Rule application complete: {stats}")
         return stats
     
@@ -467,10 +1024,15 @@ class RulesEngine:
             'rule_set_results': {}
         }
         
-        for rule_file in rule_files:
-            logger.info(f"Applying rules from {rule_file}")
-            stats = self.apply_rules_to_emails(emails, rule_file)
-            overall_stats['rule_set_results'][rule_file] = stats
+        # Rules repeated across rule sets are evaluated once per email
+        self.evaluator.result_cache = {}
+        try:
+            for rule_file in rule_files:
+                logger.info(f"Applying rules from {rule_file}")
+                stats = self.apply_rules_to_emails(emails, rule_file)
+                overall_stats['rule_set_results'][rule_file] = stats
+        finally:
+            self.evaluator.result_cache = None
         
         return overall_stats
 
@@ -5,61 +5,76 @@ Initializes the application and creates necessary configuration files.
 """
 
 import os
+import re
 import sys
 import json
 import shutil
+import sysconfig
+import importlib.util
+from importlib.metadata import distributions
 
 def create_directory_structure():
     """Create necessary directories."""
     directories = ['logs', 'tests']
     
     for directory in directories:
-        os.makedirs(directory, exist_ok=True)
-        print(f"✅ Created directory: {directory}")
+        try:
+            os.makedirs(directory)
+            print(f"✅ Created directory: {directory}")
+        except FileExistsError:
+            print(f"ℹ️  Directory already exists: {directory}")
 
 def create_env_file():
     """Create .env file from template if it doesn't exist."""
-    if not os.path.exists('.env'):
-        if os.path.exists('.env.example'):
-            shutil.copy('.env.example', '.env')
-            print("✅ Created .env file from template")
-            print("📝 Please edit .env file with your configuration")
-        else:
-            print("⚠️  .env.example not found, please create .env manually")
-    else:
+    try:
+        # Exclusive create: fails instead of overwriting an existing .env
+        dst = open('.env', 'xb')
+    except FileExistsError:
         print("ℹ️  .env file already exists")
+        return
+    
+    try:
+        with dst, open('.env.example', 'rb') as src:
+            shutil.copyfileobj(src, dst)
+    except FileNotFoundError:
+        # Don't leave an empty .env behind that would hide the missing template
+        os.remove('.env')
+        print("⚠️  .env.example not found, please create .env manually")
+        return
+    
+    print("✅ Created .env file from template")
+    print("📝 Please edit .env file with your configuration")
 
 def create_sample_rules():
     """Create sample rules file if it doesn't exist."""
-    if not os.path.exists('rules.json'):
-        sample_rules = {
-            "id": "sample_rule",
-            "name": "Sample Email Rule",
-            "description": "Mark GitHub notifications as read and move to Important",
-            "predicate": "ALL",
-            "rules": [
-                {
-                    "field": "from",
-                    "predicate": "contains",
-                    "value": "noreply@github.com"
-                },
-                {
-                    "field": "subject",
-                    "predicate": "does not contain",
-                    "value": "release"
-                }
-            ],
-            "actions": [
-                "mark_as_read",
-                "move:Important"
-            ]
-        }
-        
-        with open('rules.json', 'w') as f:
+    sample_rules = {
+        "id": "sample_rule",
+        "name": "Sample Email Rule",
+        "description": "Mark GitHub notifications as read and move to Important",
+        "predicate": "ALL",
+        "rules": [
+            {
+                "field": "from",
+                "predicate": "contains",
+                "value": "noreply@github.com"
+            },
+            {
+                "field": "subject",
+                "predicate": "does not contain",
+                "value": "release"
+            }
+        ],
+        "actions": [
+            "mark_as_read",
+            "move:Important"
+        ]
+    }
+    
+    try:
+        with open('rules.json', 'x') as f:
             json.dump(sample_rules, f, indent=2)
-        
         print("✅ Created sample rules.json file")
-    else:
+    except FileExistsError:
         print("ℹ️  rules.json file already exists")
 
 def check_python_version():
@@ -70,6 +85,40 @@ def check_python_version():
     
     print(f"✅ Python version: {sys.version}")
 
+def _normalize_package_name(name):
+    """Normalize a distribution name for comparison (PEP 503)."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+DEPENDENCY_CACHE_FILE = '.setup_cache.json'
+
+def _environment_key():
+    """Describe the interpreter and its site-packages for the dependency cache."""
+    site_dirs = sorted({sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']})
+    mtimes = []
+    for site_dir in site_dirs:
+        try:
+            mtimes.append(os.stat(site_dir).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return [sys.prefix, list(sys.version_info[:2]), site_dirs, mtimes]
+
+def _dependencies_cached(key):
+    """Return True if a previous run found all dependencies in this environment."""
+    try:
+        with open(DEPENDENCY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    return isinstance(cached, dict) and cached.get('key') == key and cached.get('ok') is True
+
+def _write_dependency_cache(key):
+    """Record that all dependencies were found in this environment."""
+    try:
+        with open(DEPENDENCY_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'ok': True}, f)
+    except OSError:
+        pass  # The cache is only an optimization
+
 def check_dependencies():
     """Check if required dependencies are installed."""
     # Map package names to their import names
@@ -79,16 +128,27 @@ def check_dependencies():
         'google-api-python-client': 'googleapiclient',
         'python-dotenv': 'dotenv',
         'click': 'click',
-        'google-auth-httplib2': 'google.auth.transport.requests',
+        'google-auth-httplib2': 'google_auth_httplib2',
         'google-auth-oauthlib': 'google_auth_oauthlib'
     }
     
+    # Read installed distribution metadata rather than importing each package
+    installed = {
+        _normalize_package_name(dist.metadata['Name'])
+        for dist in distributions() if dist.metadata['Name']
+    }
+    
     missing_packages = []
     
     for package_name, import_name in package_imports.items():
+        if _normalize_package_name(package_name) in installed:
+            continue
+        # Not installed as a distribution (e.g. vendored); look for the module without running it
         try:
-            __import__(import_name)
-        except ImportError:
+            found = importlib.util.find_spec(import_name) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
             missing_packages.append(package_name)
     
     if missing_packages:
@@ -145,8 +205,15 @@ def main():
     create_env_file()
     create_sample_rules()
     
-    # Check dependencies
-    dependencies_ok = check_dependencies()
+    # Check dependencies, skipping the probe if site-packages is unchanged since the last success
+    environment_key = _environment_key()
+    if _dependencies_cached(environment_key):
+        print("✅ All required dependencies are installed (cached)")
+        dependencies_ok = True
+    else:
+        dependencies_ok = check_dependencies()
+        if dependencies_ok:
+            _write_dependency_cache(environment_key)
     
     if dependencies_ok:
         display_next_steps()
@@ -3,35 +3,41 @@ Test configuration and fixtures for Gmail Rule Engine tests.
 """
 
 import pytest
-import tempfile
 import os
+import shutil
 from datetime import datetime, timezone
 from unittest.mock import Mock, patch
 
-from database import DatabaseManager, Email, RuleApplied
-from gmail_service import GmailService
-from rules_engine import RulesEngine
-from config import Config
+# Application modules (SQLAlchemy, Google API client) are imported inside the
+# fixtures that need them so unrelated test runs don't pay for loading them
+
+
+@pytest.fixture(scope='session')
+def db_template(tmp_path_factory):
+    """Database file with the schema already created, copied by each temp_db."""
+    from database import DatabaseManager
+    
+    template_path = tmp_path_factory.mktemp('db') / 'template.db'
+    db_manager = DatabaseManager(f'sqlite:///{template_path}')
+    db_manager.engine.dispose()
+    return template_path
 
 
 @pytest.fixture
-def temp_db():
+def temp_db(db_template, tmp_path):
     """Create a temporary database for testing."""
-    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as temp_file:
-        temp_db_url = f'sqlite:///{temp_file.name}'
-        temp_file_path = temp_file.name
+    from database import DatabaseManager
     
-    db_manager = DatabaseManager(temp_db_url)
+    db_path = tmp_path / 'test.db'
+    
+    # Start from the prebuilt schema instead of running the DDL again
+    shutil.copyfile(db_template, db_path)
+    db_manager = DatabaseManager(f'sqlite:///{db_path}')
     try:
         yield db_manager
     finally:
-        # Cleanup - close database connections first
-        if hasattr(db_manager, 'engine') and db_manager.engine:
-            db_manager.engine.dispose()
-        try:
-            os.unlink(temp_file_path)
-        except (OSError, PermissionError):
-            pass  # Ignore cleanup errors on Windows
+        # Close database connections; pytest removes tmp_path itself
+        db_manager.engine.dispose()
 
 
 @pytest.fixture
@@ -46,7 +52,7 @@ def sample_email_data():
         'body': 'This is a test email body content.',
         'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),
         'is_read': False,
-        'labels': '["INBOX", "UNREAD"]'
+        'labels': ['INBOX', 'UNREAD']
     }
 
 
@@ -57,6 +63,16 @@ def sample_email_object(temp_db, sample_email_data):
     return email
 
 
+@pytest.fixture
+def many_emails(temp_db, sample_email_data):
+    """Factory that saves n sample emails in a single transaction."""
+    def _make(n):
+        return temp_db.save_emails(
+            dict(sample_email_data, gmail_id=f'test_email_{i}') for i in range(n)
+        )
+    return _make
+
+
 @pytest.fixture
 def sample_rules():
     """Sample rules configuration for testing."""
@@ -83,12 +99,15 @@ def sample_rules():
 @pytest.fixture
 def mock_gmail_service():
     """Mock Gmail service for testing."""
+    from gmail_service import GmailService
+    
     service = Mock(spec=GmailService)
     service.mark_as_read.return_value = True
     service.mark_as_unread.return_value = True
     service.move_to_label.return_value = True
     service.archive_message.return_value = True
     service.delete_message.return_value = True
+    service.execute_actions.side_effect = lambda actions: [True] * len(actions)
     return service
 
 
@@ -137,15 +156,16 @@ def temp_rules_file(temp_dir, sample_rules):
 
 
 @pytest.fixture
-def temp_dir():
+def temp_dir(tmp_path):
     """Create a temporary directory."""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        yield temp_dir
+    return str(tmp_path)
 
 
 @pytest.fixture
 def test_config(temp_dir):
     """Create test configuration."""
+    from config import Config
+    
     config = Config()
     config.db_url = f'sqlite:///{os.path.join(temp_dir, "test.db")}'
     config.rules_file = os.path.join(temp_dir, 'rules.json')
@@ -3,13 +3,25 @@ Tests for configuration management.
 """
 
 import pytest
-import tempfile
 import os
 from unittest.mock import patch
 
 from config import Config
 
 
+@pytest.fixture
+def valid_config(tmp_path):
+    """Config pointing at existing credentials/rules files and a writable log path."""
+    (tmp_path / 'credentials.json').touch()
+    (tmp_path / 'rules.json').touch()
+    
+    config = Config()
+    config.credentials_file = str(tmp_path / 'credentials.json')
+    config.rules_file = str(tmp_path / 'rules.json')
+    config.log_file = str(tmp_path / 'app.log')
+    return config
+
+
 class TestConfig:
     """Test Config class."""
     
@@ -58,6 +70,12 @@ class TestConfig:
         
         assert config.validate() is False
     
+    def test_validate_credentials_path_is_directory(self, valid_config, tmp_path):
+        """Test validation rejects a directory in place of the credentials file."""
+        valid_config.credentials_file = str(tmp_path)
+        
+        assert valid_config.validate() is False
+    
     def test_validate_missing_rules_file(self):
         """Test validation with missing rules file."""
         config = Config()
@@ -65,129 +83,39 @@ class TestConfig:
         
         assert config.validate() is False
     
-    def test_validate_invalid_log_level(self):
-        """Test validation with invalid log level."""
-        config = Config()
-        config.log_level = 'INVALID_LEVEL'
-        
-        # Create temporary files to avoid other validation errors
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as creds_file:
-            config.credentials_file = creds_file.name
-            creds_file_path = creds_file.name
-        
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as rules_file:
-            config.rules_file = rules_file.name
-            rules_file_path = rules_file.name
-            
-        assert config.validate() is False
-        
-        # Cleanup
-        try:
-            os.unlink(creds_file_path)
-        except (OSError, PermissionError):
-            pass
-        try:
-            os.unlink(rules_file_path)
-        except (OSError, PermissionError):
-            pass
-    
-    def test_validate_invalid_max_emails(self):
-        """Test validation with invalid max emails count."""
-        config = Config()
-        config.max_emails_fetch = 0
-        
-        # Create temporary files to avoid other validation errors
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as creds_file:
-            config.credentials_file = creds_file.name
-            creds_file_path = creds_file.name
-        
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as rules_file:
-            config.rules_file = rules_file.name
-            rules_file_path = rules_file.name
-            
-        assert config.validate() is False
-        
-        # Cleanup
-        try:
-            os.unlink(creds_file_path)
-        except (OSError, PermissionError):
-            pass
-        try:
-            os.unlink(rules_file_path)
-        except (OSError, PermissionError):
-            pass
+    @pytest.mark.parametrize('attribute, value', [
+        ('log_level', 'INVALID_LEVEL'),
+        ('max_emails_fetch', 0),
+    ])
+    def test_validate_invalid_setting(self, valid_config, attribute, value):
+        """Test validation with an invalid log level or max emails count."""
+        setattr(valid_config, attribute, value)
+        
+        assert valid_config.validate() is False
     
-    def test_validate_success(self):
+    def test_validate_success(self, valid_config):
         """Test successful validation."""
-        config = Config()
-        
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as creds_file:
-            config.credentials_file = creds_file.name
-            creds_file_path = creds_file.name
-        
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as rules_file:
-            config.rules_file = rules_file.name
-            rules_file_path = rules_file.name
-            
-        with tempfile.TemporaryDirectory() as temp_dir:
-            config.log_file = os.path.join(temp_dir, 'app.log')
-            
-            assert config.validate() is True
+        assert valid_config.validate() is True
+    
+    def test_validate_does_not_touch_log_directory(self, valid_config, tmp_path):
+        """Test that validation leaves log directory creation to setup_logging."""
+        log_dir = tmp_path / 'nonexistent' / 'logs'
+        valid_config.log_file = str(log_dir / 'app.log')
         
-        # Cleanup
-        try:
-            os.unlink(creds_file_path)
-        except (OSError, PermissionError):
-            pass
-        try:
-            os.unlink(rules_file_path)
-        except (OSError, PermissionError):
-            pass
+        assert valid_config.validate() is True
+        assert not log_dir.exists()
     
-    def test_validate_creates_log_directory(self):
-        """Test that validation creates log directory if it doesn't exist."""
+    def test_setup_logging(self, tmp_path):
+        """Test logging setup, including creating a missing log directory."""
         config = Config()
+        config.log_file = str(tmp_path / 'nonexistent' / 'logs' / 'test.log')
         
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as creds_file:
-            config.credentials_file = creds_file.name
-            creds_file_path = creds_file.name
+        # Setup logging should not raise an exception
+        config.setup_logging()
         
-        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as rules_file:
-            config.rules_file = rules_file.name
-            rules_file_path = rules_file.name
-            
-        with tempfile.TemporaryDirectory() as temp_dir:
-            log_dir = os.path.join(temp_dir, 'nonexistent', 'logs')
-            config.log_file = os.path.join(log_dir, 'app.log')
-            
-            assert config.validate() is True
-            assert os.path.exists(log_dir)
-        
-        # Cleanup
-        try:
-            os.unlink(creds_file_path)
-        except (OSError, PermissionError):
-            pass
-        try:
-            os.unlink(rules_file_path)
-        except (OSError, PermissionError):
-            pass
-    
-    def test_setup_logging(self):
-        """Test logging setup."""
-        config = Config()
+        # Verify log file is created after a log message
+        import logging
+        logger = logging.getLogger('test_logger')
+        logger.info('Test log message')
         
-        with tempfile.TemporaryDirectory() as temp_dir:
-            config.log_file = os.path.join(temp_dir, 'test.log')
-            
-            # Setup logging should not raise an exception
-            config.setup_logging()
-            
-            # Verify log file is created after a log message
-            import logging
-            logger = logging.getLogger('test_logger')
-            logger.info('Test log message')
-            
-            assert os.path.exists(config.log_file)
\ No newline at end of file
+        assert os.path.exists(config.log_file)
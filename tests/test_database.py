@@ -3,10 +3,12 @@ Tests for database operations and models.
 """
 
 import pytest
+from unittest.mock import patch
 from datetime import datetime, timezone
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import IntegrityError
 
-from database import DatabaseManager, Email, RuleApplied
+from database import DatabaseManager, Email, RuleApplied, SQLITE_JSON_COLUMNS_VERSION
 
 
 class TestDatabaseManager:
@@ -17,6 +19,44 @@ class TestDatabaseManager:
         assert temp_db.engine is not None
         assert temp_db.session_factory is not None
     
+    def test_sqlite_pragmas(self, temp_db):
+        """Test that SQLite connections are opened in WAL mode."""
+        with temp_db.engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+            synchronous = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+        
+        assert journal_mode == 'wal'
+        assert synchronous == 1  # NORMAL
+    
+    def test_json_columns_without_orjson(self, tmp_path, sample_email_data):
+        """Test that JSON columns round-trip with the stdlib serializer too."""
+        with patch('database.orjson', None):
+            db_manager = DatabaseManager(f'sqlite:///{tmp_path / "stdlib_json.db"}')
+        try:
+            email = db_manager.save_email(sample_email_data)
+            
+            assert db_manager.get_email_by_gmail_id(email.gmail_id).labels == ['INBOX', 'UNREAD']
+        finally:
+            db_manager.engine.dispose()
+    
+    def test_get_session_reused_per_thread(self, temp_db):
+        """Test that the same thread gets the same session back."""
+        assert temp_db.get_session() is temp_db.get_session()
+    
+    def test_rules_applied_email_index(self, temp_db):
+        """Test that rules_applied lookups by email are indexed."""
+        indexes = inspect(temp_db.engine).get_indexes('rules_applied')
+        
+        assert any(index['column_names'][:1] == ['email_id'] for index in indexes)
+    
+    def test_gmail_id_index(self, temp_db):
+        """Test that lookups by Gmail ID are indexed."""
+        indexes = inspect(temp_db.engine).get_indexes('emails')
+        
+        assert any(
+            index['column_names'] == ['gmail_id'] and index['unique'] for index in indexes
+        )
+    
     def test_save_email(self, temp_db, sample_email_data):
         """Test saving email to database."""
         email = temp_db.save_email(sample_email_data)
@@ -39,6 +79,57 @@ class TestDatabaseManager:
         assert email1.id == email2.id
         assert email1.gmail_id == email2.gmail_id
     
+    def test_save_emails_batch(self, temp_db, sample_email_data):
+        """Test saving a batch of emails in one call."""
+        saved_count = temp_db.save_emails(
+            dict(sample_email_data, gmail_id=f'test_email_{i}') for i in range(3)
+        )
+        
+        assert saved_count == 3
+        assert temp_db.get_email_count() == 3
+    
+    def test_save_emails_skips_existing(self, temp_db, sample_email_data):
+        """Test batch save skips emails already stored or repeated in the batch."""
+        temp_db.save_email(sample_email_data)
+        
+        new_email_data = dict(sample_email_data, gmail_id='test_email_new')
+        
+        saved_count = temp_db.save_emails([sample_email_data, new_email_data, new_email_data])
+        
+        assert saved_count == 1
+        assert temp_db.get_email_count() == 2
+    
+    def test_save_emails_skips_select_for_known_ids(self, temp_db, sample_email_data):
+        """Test that recently saved Gmail IDs do not trigger another lookup."""
+        temp_db.save_emails([sample_email_data])
+        
+        with patch.object(temp_db, 'get_session') as mock_get_session:
+            saved_count = temp_db.save_emails([sample_email_data])
+        
+        assert saved_count == 0
+        mock_get_session.assert_not_called()
+        
+        temp_db.clear_email_cache()
+        assert temp_db.save_emails([sample_email_data]) == 0
+    
+    def test_save_emails_tolerates_concurrent_insert(self, temp_db, sample_email_data):
+        """Test that a row stored after the duplicate check does not fail the batch."""
+        new_email_data = dict(sample_email_data, gmail_id='test_email_new')
+        
+        original_insert = temp_db._insert_new_emails
+        
+        def insert_after_check():
+            # Simulate another writer storing the email between SELECT and INSERT
+            with temp_db.engine.begin() as connection:
+                connection.execute(original_insert(), [temp_db._email_row(sample_email_data)])
+            return original_insert()
+        
+        with patch.object(temp_db, '_insert_new_emails', side_effect=insert_after_check):
+            saved_count = temp_db.save_emails([sample_email_data, new_email_data])
+        
+        assert saved_count == 1
+        assert temp_db.get_email_count() == 2
+    
     def test_get_emails(self, temp_db, sample_email_data):
         """Test retrieving emails from database."""
         # Save test email
@@ -50,18 +141,48 @@ class TestDatabaseManager:
         assert len(emails) == 1
         assert emails[0].gmail_id == sample_email_data['gmail_id']
     
-    def test_get_emails_with_limit(self, temp_db, sample_email_data):
+    def test_get_emails_with_limit(self, temp_db, many_emails):
         """Test getting emails with limit."""
         # Save multiple emails
-        for i in range(5):
-            email_data = sample_email_data.copy()
-            email_data['gmail_id'] = f'test_email_{i}'
-            temp_db.save_email(email_data)
+        many_emails(5)
         
         # Get with limit
         emails = temp_db.get_emails(limit=3)
         assert len(emails) == 3
     
+    def test_limit_selects_newest_before_filter(self, temp_db, sample_email_data):
+        """Test that limit/offset pick the newest emails, which the filter then narrows."""
+        temp_db.save_emails([
+            dict(sample_email_data, gmail_id=f'test_email_{day}',
+                 subject='Invoice' if day == 1 else 'Newsletter',
+                 received_at=datetime(2025, 9, day, 12, 0, 0, tzinfo=timezone.utc))
+            for day in range(1, 6)
+        ])
+        invoices = Email.subject == 'Invoice'
+        
+        # The only invoice is the oldest email, outside the newest two
+        assert temp_db.get_emails(limit=2, filter_clause=invoices) == []
+        assert temp_db.get_email_count(invoices, limit=2) == 0
+        
+        emails = list(temp_db.iter_emails(limit=2, offset=3, filter_clause=invoices))
+        assert [email.gmail_id for email in emails] == ['test_email_1']
+        assert temp_db.get_email_count(invoices, limit=2, offset=3) == 1
+        assert temp_db.get_email_count(limit=2, offset=4) == 1
+    
+    def test_iter_emails_streams_across_other_calls(self, temp_db, sample_email_data):
+        """Test that streamed emails survive other database calls mid-iteration."""
+        temp_db.save_emails([
+            dict(sample_email_data, gmail_id=f'test_email_{i}') for i in range(5)
+        ])
+        
+        streamed = []
+        for email in temp_db.iter_emails(limit=4, batch_size=2):
+            streamed.append(email.gmail_id)
+            temp_db.update_email_status(email.id, is_read=True)
+        
+        assert len(streamed) == 4
+        assert temp_db.get_email_count(Email.is_read.is_(True)) == 4
+    
     def test_get_email_by_gmail_id(self, temp_db, sample_email_data):
         """Test getting email by Gmail ID."""
         # Save email
@@ -109,6 +230,60 @@ class TestDatabaseManager:
         assert rule_applied.rule_name == 'Test Rule'
         assert 'mark_as_read' in rule_applied.actions_applied
     
+    def test_log_rules_applied_batch(self, temp_db, sample_email_object):
+        """Test logging several rule applications in one call."""
+        logged_count = temp_db.log_rules_applied([
+            {
+                'email_id': sample_email_object.id,
+                'rule_id': f'test_rule_{i}',
+                'rule_name': f'Test Rule {i}',
+                'actions': ['mark_as_read']
+            }
+            for i in range(2)
+        ])
+        
+        assert logged_count == 2
+        rules = temp_db.get_rules_for_email(sample_email_object.id)
+        assert {rule.rule_id for rule in rules} == {'test_rule_0', 'test_rule_1'}
+    
+    def test_legacy_actions_converted_to_json(self, temp_db, sample_email_object):
+        """Test that Python-repr actions from older databases become JSON lists."""
+        with temp_db.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO rules_applied (email_id, rule_id, rule_name, actions_applied, applied_at) "
+                "VALUES (:email_id, 'legacy_rule', 'Legacy Rule', :actions, CURRENT_TIMESTAMP)"
+            ), {'email_id': sample_email_object.id, 'actions': "['mark_as_read', 'move:Old']"})
+            # Databases from before the JSON columns were never versioned
+            connection.exec_driver_sql("PRAGMA user_version = 0")
+        
+        reopened_db = DatabaseManager(temp_db.db_url)
+        try:
+            rules = reopened_db.get_rules_for_email(sample_email_object.id)
+            assert rules[0].actions_applied == ['mark_as_read', 'move:Old']
+            
+            with reopened_db.engine.connect() as connection:
+                assert connection.exec_driver_sql("PRAGMA user_version").scalar() == SQLITE_JSON_COLUMNS_VERSION
+        finally:
+            reopened_db.engine.dispose()
+    
+    def test_json_column_upgrade_runs_once(self, temp_db, sample_email_object):
+        """Test that opening an already upgraded database leaves its rows alone."""
+        with temp_db.engine.begin() as connection:
+            assert connection.exec_driver_sql("PRAGMA user_version").scalar() == SQLITE_JSON_COLUMNS_VERSION
+            connection.execute(text(
+                "INSERT INTO rules_applied (email_id, rule_id, rule_name, actions_applied, applied_at) "
+                "VALUES (:email_id, 'repr_rule', 'Repr Rule', :actions, CURRENT_TIMESTAMP)"
+            ), {'email_id': sample_email_object.id, 'actions': "['mark_as_read']"})
+        
+        reopened_db = DatabaseManager(temp_db.db_url)
+        reopened_db.engine.dispose()
+        
+        with temp_db.engine.connect() as connection:
+            actions = connection.execute(text(
+                "SELECT actions_applied FROM rules_applied WHERE rule_id = 'repr_rule'"
+            )).scalar()
+        assert actions == "['mark_as_read']"
+    
     def test_get_rules_for_email(self, temp_db, sample_email_object):
         """Test getting rules applied to an email."""
         # Log rule application
@@ -126,16 +301,31 @@ class TestDatabaseManager:
         assert rules[0].rule_id == 'test_rule'
         assert rules[0].email_id == sample_email_object.id
     
-    def test_get_email_count(self, temp_db, sample_email_data):
+    def test_get_rules_for_emails(self, temp_db, sample_email_data):
+        """Test fetching rule applications for several emails at once."""
+        temp_db.save_emails([
+            dict(sample_email_data, gmail_id=f'test_email_{i}') for i in range(3)
+        ])
+        email_ids = [email.id for email in temp_db.get_emails()]
+        temp_db.log_rules_applied([
+            {'email_id': email_ids[0], 'rule_id': 'rule_a', 'rule_name': 'Rule A', 'actions': ['archive']},
+            {'email_id': email_ids[0], 'rule_id': 'rule_b', 'rule_name': 'Rule B', 'actions': ['archive']},
+            {'email_id': email_ids[1], 'rule_id': 'rule_a', 'rule_name': 'Rule A', 'actions': ['archive']}
+        ])
+        
+        rules_by_email = temp_db.get_rules_for_emails(email_ids)
+        
+        assert [rule.rule_id for rule in rules_by_email[email_ids[0]]] == ['rule_a', 'rule_b']
+        assert len(rules_by_email[email_ids[1]]) == 1
+        assert email_ids[2] not in rules_by_email
+    
+    def test_get_email_count(self, temp_db, many_emails):
         """Test getting total email count."""
         # Initially should be 0
         assert temp_db.get_email_count() == 0
         
         # Save emails
-        for i in range(3):
-            email_data = sample_email_data.copy()
-            email_data['gmail_id'] = f'test_email_{i}'
-            temp_db.save_email(email_data)
+        many_emails(3)
         
         # Should now be 3
         assert temp_db.get_email_count() == 3
@@ -160,6 +350,7 @@ class TestEmailModel:
         assert email_dict['gmail_id'] == sample_email_object.gmail_id
         assert email_dict['from'] == sample_email_object.from_address
         assert email_dict['subject'] == sample_email_object.subject
+        assert email_dict['labels'] == ['INBOX', 'UNREAD']
         assert 'received_at' in email_dict
         assert 'created_at' in email_dict
 
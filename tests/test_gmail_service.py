@@ -4,13 +4,31 @@ Tests for Gmail service functionality.
 
 import pytest
 from unittest.mock import Mock, patch, mock_open
-from datetime import datetime
+from datetime import datetime, timezone
 import base64
+from googleapiclient.errors import HttpError
 
 import gmail_service
 from gmail_service import GmailService
 
 
+def _fake_batch(callback):
+    """Build a stand-in for BatchHttpRequest that executes requests in order."""
+    requests = []
+    batch = Mock()
+    batch.add.side_effect = lambda request, request_id=None: requests.append((request_id, request))
+    
+    def execute():
+        for request_id, request in requests:
+            try:
+                callback(request_id, request.execute(), None)
+            except Exception as e:
+                callback(request_id, None, e)
+    
+    batch.execute.side_effect = execute
+    return batch
+
+
 class TestGmailService:
     """Test GmailService class."""
     
@@ -42,6 +60,11 @@ class TestGmailService:
                         assert service.credentials is not None
                         assert service.service is not None
                         mock_build.assert_called_once()
+                        
+                        # Requests share one authorized keep-alive HTTP client
+                        http = mock_build.call_args.kwargs['http']
+                        assert http.credentials is mock_credentials
+                        assert http.http.timeout == gmail_service.HTTP_TIMEOUT
     
     def test_authenticate_expired_token_refresh(self, mock_credentials):
         """Test authentication with expired token that gets refreshed."""
@@ -83,6 +106,7 @@ class TestGmailService:
         mock_gmail_service.users().messages().list().execute.return_value = mock_gmail_api_response
         mock_gmail_service.users().messages().get().execute.return_value = mock_gmail_message
         mock_gmail_service.users().labels().list().execute.return_value = {'labels': []}
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
         
         with patch('gmail_service.GmailService._authenticate'):
             service = GmailService()
@@ -94,6 +118,69 @@ class TestGmailService:
             assert emails[0]['gmail_id'] == 'msg_123'
             assert emails[0]['from'] == 'test@example.com'
             assert emails[0]['subject'] == 'Test Email Subject'
+            mock_gmail_service.new_batch_http_request.assert_called_once()
+    
+    def test_fetch_emails_follows_page_token(self, mock_gmail_service, mock_gmail_message):
+        """Test that listing continues across pages until max_results is reached."""
+        second_message = dict(mock_gmail_message, id='msg_456')
+        mock_gmail_service.users().messages().list().execute.side_effect = [
+            {'messages': [{'id': 'msg_123'}], 'nextPageToken': 'page_2'},
+            {'messages': [{'id': 'msg_456'}]}
+        ]
+        mock_gmail_service.users().messages().get().execute.side_effect = [
+            mock_gmail_message, second_message
+        ]
+        mock_gmail_service.users().labels().list().execute.return_value = {'labels': []}
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            batches = list(service.iter_email_batches(max_results=5))
+            
+            assert [email['gmail_id'] for batch in batches for email in batch] == ['msg_123', 'msg_456']
+            mock_gmail_service.users().messages().list.assert_called_with(
+                userId='me', maxResults=4, q='', pageToken='page_2'
+            )
+    
+    def test_fetch_emails_without_body(self, mock_gmail_service, mock_gmail_api_response, mock_gmail_message):
+        """Test fetching headers only requests metadata and skips the body."""
+        mock_gmail_service.users().messages().list().execute.return_value = mock_gmail_api_response
+        mock_gmail_service.users().messages().get().execute.return_value = mock_gmail_message
+        mock_gmail_service.users().labels().list().execute.return_value = {'labels': []}
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            emails = service.fetch_emails(max_results=1, include_body=False)
+            
+            assert len(emails) == 1
+            assert emails[0]['body'] is None
+            assert emails[0]['subject'] == 'Test Email Subject'
+            mock_gmail_service.users().messages().get.assert_called_with(
+                userId='me',
+                id='msg_123',
+                format='metadata',
+                metadataHeaders=['From', 'To', 'Subject', 'Date'],
+                fields='id,threadId,labelIds,internalDate,payload/headers'
+            )
+    
+    def test_fetch_emails_batch_error(self, mock_gmail_service, mock_gmail_api_response):
+        """Test that a failed message in a batch is skipped."""
+        mock_gmail_service.users().messages().list().execute.return_value = mock_gmail_api_response
+        mock_gmail_service.users().messages().get().execute.side_effect = Exception('Not found')
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            emails = service.fetch_emails(max_results=1)
+            
+            assert emails == []
     
     def test_extract_email_body_plain_text(self):
         """Test extracting plain text email body."""
@@ -110,6 +197,20 @@ class TestGmailService:
             body = service._extract_email_body(payload)
             assert body == 'This is test content'
     
+    def test_extract_email_body_without_pybase64(self):
+        """Test that bodies decode the same with the stdlib decoder."""
+        data = base64.urlsafe_b64encode('Ünïcode body ~~~???'.encode()).decode()
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            payload = {'body': {'data': data}}
+            
+            with patch('gmail_service.pybase64', None):
+                stdlib_body = service._extract_email_body(payload)
+            
+            assert stdlib_body == 'Ünïcode body ~~~???'
+            assert service._extract_email_body(payload) == stdlib_body
+    
     def test_extract_email_body_multipart(self):
         """Test extracting multipart email body."""
         with patch('gmail_service.GmailService._authenticate'):
@@ -135,6 +236,37 @@ class TestGmailService:
             body = service._extract_email_body(payload)
             assert body == 'Plain text content'
     
+    def test_extract_email_body_nested_multipart(self):
+        """Test extracting body text from nested multipart trees."""
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            
+            payload = {
+                'mimeType': 'multipart/mixed',
+                'parts': [
+                    {
+                        'mimeType': 'multipart/alternative',
+                        'parts': [
+                            {
+                                'mimeType': 'text/plain',
+                                'body': {'data': base64.urlsafe_b64encode(b'First part. ').decode()}
+                            },
+                            {
+                                'mimeType': 'text/html',
+                                'body': {'data': base64.urlsafe_b64encode(b'<p>First part.</p>').decode()}
+                            }
+                        ]
+                    },
+                    {
+                        'mimeType': 'text/plain',
+                        'body': {'data': base64.urlsafe_b64encode(b'Forwarded part.').decode()}
+                    }
+                ]
+            }
+            
+            body = service._extract_email_body(payload)
+            assert body == 'First part. Forwarded part.'
+    
     def test_parse_email_date(self):
         """Test parsing email date."""
         with patch('gmail_service.GmailService._authenticate'):
@@ -149,6 +281,17 @@ class TestGmailService:
             assert parsed_date.month == 9
             assert parsed_date.day == 26
     
+    def test_parse_message_uses_internal_date(self, mock_gmail_message):
+        """Test that Gmail's internalDate is used for the received time."""
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service._label_map = {}
+            
+            message = dict(mock_gmail_message, internalDate='1758888000000')
+            email_data = service._parse_message(message)
+            
+            assert email_data['received_at'] == datetime(2025, 9, 26, 12, 0, tzinfo=timezone.utc)
+    
     def test_mark_as_read(self, mock_gmail_service):
         """Test marking email as read."""
         mock_gmail_service.users().messages().modify().execute.return_value = {}
@@ -267,6 +410,108 @@ class TestGmailService:
                 id='test_message_id'
             )
     
+    def test_execute_actions_batched(self, mock_gmail_service):
+        """Test executing several actions with batchModify and one batch request."""
+        batch_modify = mock_gmail_service.users().messages().batchModify
+        mock_gmail_service.users().messages().trash().execute.side_effect = Exception('Not found')
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            batch_modify.reset_mock()
+            
+            results = service.execute_actions([
+                ('mark_as_read', 'msg_1', None),
+                ('archive', 'msg_2', None),
+                ('delete', 'msg_3', None),
+                ('unknown', 'msg_4', None),
+                ('mark_as_read', 'msg_5', None)
+            ])
+            
+            assert results == [True, True, False, False, True]
+            assert batch_modify.call_count == 2
+            batch_modify.assert_any_call(
+                userId='me', body={'removeLabelIds': ['UNREAD'], 'ids': ['msg_1', 'msg_5']}
+            )
+            batch_modify.assert_any_call(
+                userId='me', body={'removeLabelIds': ['INBOX'], 'ids': ['msg_2']}
+            )
+            mock_gmail_service.new_batch_http_request.assert_called_once()
+    
+    def test_execute_actions_keeps_order_per_message(self, mock_gmail_service):
+        """Test that each message's actions are sent in the order given."""
+        sent = []
+        messages = mock_gmail_service.users().messages()
+        messages.batchModify.side_effect = lambda userId, body: sent.append(('modify', body)) or Mock()
+        messages.trash.side_effect = lambda userId, id: sent.append(('trash', id)) or Mock()
+        mock_gmail_service.new_batch_http_request.side_effect = _fake_batch
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            results = service.execute_actions([
+                ('mark_as_read', 'msg_1', None),
+                ('mark_as_unread', 'msg_1', None),
+                ('mark_as_read', 'msg_2', None),
+                ('delete', 'msg_1', None)
+            ])
+            
+            assert results == [True, True, True, True]
+            assert sent == [
+                ('modify', {'removeLabelIds': ['UNREAD'], 'ids': ['msg_1', 'msg_2']}),
+                ('modify', {'addLabelIds': ['UNREAD'], 'ids': ['msg_1']}),
+                ('trash', 'msg_1')
+            ]
+    
+    def test_execute_actions_batch_modify_failure(self, mock_gmail_service):
+        """Test that a failed batchModify marks each of its actions as failed."""
+        error = HttpError(Mock(status=500), b'Server error')
+        mock_gmail_service.users().messages().batchModify().execute.side_effect = error
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            results = service.execute_actions([
+                ('mark_as_read', 'msg_1', None),
+                ('mark_as_read', 'msg_2', None)
+            ])
+            
+            assert results == [False, False]
+    
+    def test_execute_actions_transport_error(self, mock_gmail_service):
+        """Test that transport errors fail their chunk instead of escaping."""
+        mock_gmail_service.users().messages().batchModify().execute.side_effect = TimeoutError('timed out')
+        mock_gmail_service.new_batch_http_request.return_value.execute.side_effect = ConnectionResetError()
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            results = service.execute_actions([
+                ('mark_as_read', 'msg_1', None),
+                ('delete', 'msg_2', None)
+            ])
+            
+            assert results == [False, False]
+    
+    def test_execute_actions_label_lookup_error(self, mock_gmail_service):
+        """Test that a transport error resolving a move's label fails that action only."""
+        mock_gmail_service.users().labels().list().execute.side_effect = TimeoutError('timed out')
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            results = service.execute_actions([
+                ('move', 'msg_1', 'Important'),
+                ('mark_as_read', 'msg_2', None)
+            ])
+            
+            assert results == [False, True]
+    
     def test_get_label_names(self, mock_gmail_service):
         """Test converting label IDs to names."""
         mock_gmail_service.users().labels().list().execute.return_value = {
@@ -284,6 +529,42 @@ class TestGmailService:
             label_names = service._get_label_names(['INBOX', 'UNREAD', 'label_123'])
             
             assert label_names == ['INBOX', 'UNREAD', 'Important']
+    
+    def test_label_map_is_cached(self, mock_gmail_service):
+        """Test that labels are fetched once and refetched after invalidation."""
+        labels_list = mock_gmail_service.users().labels().list()
+        labels_list.execute.return_value = {
+            'labels': [{'id': 'label_123', 'name': 'Important'}]
+        }
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            service._get_label_names(['label_123'])
+            service._get_label_names(['label_123'])
+            assert labels_list.execute.call_count == 1
+            
+            service.invalidate_label_cache()
+            service._get_label_names(['label_123'])
+            assert labels_list.execute.call_count == 2
+    
+    def test_created_label_added_to_cache(self, mock_gmail_service):
+        """Test that a newly created label is reused without refetching labels."""
+        labels_list = mock_gmail_service.users().labels().list()
+        labels_list.execute.return_value = {'labels': []}
+        mock_gmail_service.users().labels().create().execute.return_value = {
+            'id': 'new_label_123', 'name': 'NewLabel'
+        }
+        
+        with patch('gmail_service.GmailService._authenticate'):
+            service = GmailService()
+            service.service = mock_gmail_service
+            
+            assert service._get_or_create_label('NewLabel') == 'new_label_123'
+            assert service._get_or_create_label('NewLabel') == 'new_label_123'
+            assert service._get_label_names(['new_label_123']) == ['NewLabel']
+            assert labels_list.execute.call_count == 1
 
 
 def test_create_gmail_service():
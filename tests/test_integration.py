@@ -4,8 +4,6 @@ Integration tests for the complete Gmail Rule Engine system.
 
 import pytest
 import json
-import tempfile
-import os
 from unittest.mock import Mock, patch
 from datetime import datetime, timezone
 
@@ -19,14 +17,12 @@ class TestGmailRuleEngineIntegration:
     """Integration tests for the complete system."""
     
     @pytest.fixture
-    def integration_setup(self):
+    def integration_setup(self, tmp_path):
         """Set up complete integration test environment."""
-        # Create temporary database
-        temp_db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
-        temp_db_file.close()
+        db_file = str(tmp_path / 'test.db')
+        rules_file = str(tmp_path / 'rules.json')
         
         # Create temporary rules file
-        temp_rules_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
         rules_config = {
             'id': 'integration_test_rule',
             'name': 'Integration Test Rule',
@@ -45,16 +41,17 @@ class TestGmailRuleEngineIntegration:
             ],
             'actions': ['mark_as_read', 'move:ProcessedEmails']
         }
-        json.dump(rules_config, temp_rules_file)
-        temp_rules_file.close()
+        with open(rules_file, 'w') as f:
+            json.dump(rules_config, f)
         
         # Create database manager
-        db_manager = DatabaseManager(f'sqlite:///{temp_db_file.name}')
+        db_manager = DatabaseManager(f'sqlite:///{db_file}')
         
         # Mock Gmail service
         mock_gmail_service = Mock(spec=GmailService)
         mock_gmail_service.mark_as_read.return_value = True
         mock_gmail_service.move_to_label.return_value = True
+        mock_gmail_service.execute_actions.side_effect = lambda actions: [True] * len(actions)
         
         # Create rules engine
         rules_engine = RulesEngine(mock_gmail_service)
@@ -63,24 +60,12 @@ class TestGmailRuleEngineIntegration:
             'db_manager': db_manager,
             'gmail_service': mock_gmail_service,
             'rules_engine': rules_engine,
-            'rules_file': temp_rules_file.name,
-            'db_file': temp_db_file.name
+            'rules_file': rules_file,
+            'db_file': db_file
         }
         
-        # Cleanup - close file handles and database connections first
-        temp_rules_file.close()
-        temp_db_file.close()
-        if hasattr(db_manager, 'engine') and db_manager.engine:
-            db_manager.engine.dispose()
-        
-        try:
-            os.unlink(temp_db_file.name)
-        except (OSError, PermissionError):
-            pass
-        try:
-            os.unlink(temp_rules_file.name)
-        except (OSError, PermissionError):
-            pass
+        # Close database connections; pytest removes tmp_path itself
+        db_manager.engine.dispose()
     
     def test_complete_email_processing_workflow(self, integration_setup):
         """Test complete workflow from email storage to rule application."""
@@ -101,7 +86,7 @@ class TestGmailRuleEngineIntegration:
                 'body': 'This is test email 1',
                 'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),
                 'is_read': False,
-                'labels': '["INBOX", "UNREAD"]'
+                'labels': ['INBOX', 'UNREAD']
             },
             {
                 'gmail_id': 'test_email_2',
@@ -112,7 +97,7 @@ class TestGmailRuleEngineIntegration:
                 'body': 'This is test email 2',
                 'received_at': datetime(2025, 9, 26, 13, 0, 0, tzinfo=timezone.utc),
                 'is_read': False,
-                'labels': '["INBOX", "UNREAD"]'
+                'labels': ['INBOX', 'UNREAD']
             },
             {
                 'gmail_id': 'test_email_3',
@@ -123,18 +108,16 @@ class TestGmailRuleEngineIntegration:
                 'body': 'This is test email 3',
                 'received_at': datetime(2025, 9, 26, 14, 0, 0, tzinfo=timezone.utc),
                 'is_read': False,
-                'labels': '["INBOX", "UNREAD"]'
+                'labels': ['INBOX', 'UNREAD']
             }
         ]
         
-        saved_emails = []
-        for email_data in test_emails:
-            saved_email = db_manager.save_email(email_data)
-            assert saved_email is not None
-            saved_emails.append(saved_email)
+        # Saved in one transaction, as the fetch command does
+        assert db_manager.save_emails(test_emails) == 3
         
         # Verify emails are saved
         assert db_manager.get_email_count() == 3
+        saved_emails = list(reversed(db_manager.get_emails()))
         
         # Step 2: Apply rules to emails
         with patch('rules_engine.db_manager', db_manager):
@@ -147,9 +130,17 @@ class TestGmailRuleEngineIntegration:
         assert stats['matched'] == 2  # test_email_1 and test_email_3
         assert stats['failed'] == 0
         
-        # Verify Gmail service was called correctly
-        assert gmail_service.mark_as_read.call_count == 2
-        assert gmail_service.move_to_label.call_count == 2
+        # Verify all actions were sent to Gmail in one batched call
+        gmail_service.execute_actions.assert_called_once_with([
+            ('mark_as_read', 'test_email_1', None),
+            ('move', 'test_email_1', 'ProcessedEmails'),
+            ('mark_as_read', 'test_email_3', None),
+            ('move', 'test_email_3', 'ProcessedEmails')
+        ])
+        
+        # Verify read status was updated for matched emails only
+        assert db_manager.get_email_by_gmail_id('test_email_1').is_read is True
+        assert db_manager.get_email_by_gmail_id('test_email_2').is_read is False
         
         # Verify rule applications were logged
         rules_applied = db_manager.get_rules_for_email(saved_emails[0].id)
@@ -170,7 +161,7 @@ class TestGmailRuleEngineIntegration:
             'body': 'This is a duplicate test',
             'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),
             'is_read': False,
-            'labels': '["INBOX", "UNREAD"]'
+            'labels': ['INBOX', 'UNREAD']
         }
         
         # Save email first time
@@ -201,7 +192,7 @@ class TestGmailRuleEngineIntegration:
             'body': 'This is a test email',
             'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),
             'is_read': False,
-            'labels': '["INBOX", "UNREAD"]'
+            'labels': ['INBOX', 'UNREAD']
         }
         
         saved_email = db_manager.save_email(email_data)
@@ -252,7 +243,7 @@ class TestGmailRuleEngineIntegration:
             'body': 'This is an old email',
             'received_at': datetime(2025, 9, 16, 12, 0, 0, tzinfo=timezone.utc),  # 10 days ago
             'is_read': False,
-            'labels': '["INBOX", "UNREAD"]'
+            'labels': ['INBOX', 'UNREAD']
         }
         
         # Create recent email
@@ -265,7 +256,7 @@ class TestGmailRuleEngineIntegration:
             'body': 'This is a recent email',
             'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),  # Today
             'is_read': False,
-            'labels': '["INBOX", "UNREAD"]'
+            'labels': ['INBOX', 'UNREAD']
         }
         
         old_email = db_manager.save_email(old_email_data)
@@ -326,7 +317,7 @@ class TestGmailRuleEngineIntegration:
             'body': 'Testing action failure handling',
             'received_at': datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc),
             'is_read': False,
-            'labels': '["INBOX", "UNREAD"]'
+            'labels': ['INBOX', 'UNREAD']
         }
         
         saved_email = db_manager.save_email(email_data)
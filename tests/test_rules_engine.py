@@ -4,14 +4,14 @@ Tests for rules engine functionality.
 
 import pytest
 import json
-import tempfile
 import os
+import re
 from datetime import datetime, timezone, timedelta
 from unittest.mock import Mock, patch
 
 from rules_engine import (
     RulesPredicate, DatePredicate, RuleEvaluator, 
-    RuleAction, RulesEngine
+    RuleAction, RulesEngine, _compile_pattern, _pin_clock, compile_rule
 )
 from database import Email
 
@@ -61,6 +61,36 @@ class TestRulesPredicate:
         
         # Test invalid regex
         assert RulesPredicate.regex_match("test", "[invalid") is False
+    
+    def test_regex_pattern_compiled_once(self):
+        """Test that a regex pattern is compiled once and reused."""
+        _compile_pattern.cache_clear()
+        
+        for value in ("Invoice 1", "Invoice 2", "Receipt"):
+            RulesPredicate.regex_match(value, r"invoice \d")
+        
+        assert _compile_pattern.cache_info().misses == 1
+    
+    def test_regex_prefers_re2_when_installed(self):
+        """Test that re2 compiles supported patterns and re handles the rest."""
+        def re2_compile(pattern):
+            if '\\1' in pattern:
+                raise ValueError("backreferences are not supported")
+            return re.compile(pattern)
+        
+        fake_re2 = Mock()
+        fake_re2.compile.side_effect = re2_compile
+        _compile_pattern.cache_clear()
+        
+        try:
+            with patch('rules_engine.re2', fake_re2):
+                assert RulesPredicate.regex_match("Invoice 42", r"invoice \d+") is True
+                assert RulesPredicate.regex_match("abab", r"(ab)\1") is True
+        finally:
+            _compile_pattern.cache_clear()
+        
+        assert fake_re2.compile.call_count == 2
+        fake_re2.compile.assert_any_call(r"(?i)invoice \d+")
 
 
 class TestDatePredicate:
@@ -83,6 +113,10 @@ class TestDatePredicate:
         
         assert DatePredicate.greater_than_days_ago(week_ago, 3) is True
         assert DatePredicate.greater_than_days_ago(yesterday, 3) is False
+        
+        # Compared against a given time instead of the clock
+        assert DatePredicate.greater_than_days_ago(yesterday, 3, now + timedelta(days=5)) is True
+        assert DatePredicate.less_than_days_ago(yesterday, 3, now + timedelta(days=5)) is False
     
     def test_equals_date(self):
         """Test equals date predicate."""
@@ -119,15 +153,15 @@ class TestRuleEvaluator:
     @pytest.fixture
     def test_email(self):
         """Create test email object."""
-        email = Mock(spec=Email)
-        email.id = 1
-        email.from_address = "test@example.com"
-        email.to_address = "user@gmail.com"
-        email.subject = "Test Email Subject"
-        email.body = "This is a test email body"
-        email.labels = '["INBOX", "UNREAD"]'
-        email.received_at = datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc)
-        return email
+        return Email(
+            id=1,
+            from_address="test@example.com",
+            to_address="user@gmail.com",
+            subject="Test Email Subject",
+            body="This is a test email body",
+            labels=['INBOX', 'UNREAD'],
+            received_at=datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc)
+        )
     
     def test_evaluate_from_field(self, evaluator, test_email):
         """Test evaluating 'from' field."""
@@ -166,6 +200,32 @@ class TestRuleEvaluator:
         
         assert evaluator.evaluate_rule(rule, test_email) is True
     
+    def test_evaluate_labels_field(self, evaluator, test_email):
+        """Test evaluating 'labels' stored as a list."""
+        test_email.labels = ['INBOX', 'Important']
+        rule = {
+            'field': 'labels',
+            'predicate': 'contains',
+            'value': 'important'
+        }
+        
+        assert evaluator.evaluate_rule(rule, test_email) is True
+    
+    def test_evaluate_rules_share_lowered_field(self, evaluator, test_email):
+        """Test that rules on the same field read and lowercase it once."""
+        rules = [
+            {'field': 'subject', 'predicate': 'contains', 'value': 'TEST'},
+            {'field': 'subject', 'predicate': 'ends with', 'value': 'subject'},
+        ]
+        lowered_fields = {}
+        get_subject = Mock(return_value=test_email.subject)
+        
+        with patch.dict('rules_engine.EMAIL_FIELD_GETTERS', {'subject': get_subject}):
+            assert all(evaluator.evaluate_rule(rule, test_email, lowered_fields) for rule in rules)
+        
+        assert get_subject.call_count == 1
+        assert lowered_fields == {'subject': 'test email subject'}
+    
     def test_evaluate_date_field(self, evaluator, test_email):
         """Test evaluating date field."""
         rule = {
@@ -190,6 +250,13 @@ class TestRuleEvaluator:
         
         assert evaluator.evaluate_rule(rule, test_email) is False
     
+    def test_evaluate_non_string_rule_cached(self, evaluator, test_email):
+        """Test that non-string fields and predicates from JSON do not break the result cache."""
+        evaluator.result_cache = {}
+        
+        assert evaluator.evaluate_rule({'field': None, 'predicate': 'contains', 'value': 'test'}, test_email) is False
+        assert evaluator.evaluate_rule({'field': 'from', 'predicate': 1, 'value': 'test'}, test_email) is False
+    
     def test_evaluate_unknown_predicate(self, evaluator, test_email):
         """Test evaluating unknown predicate."""
         rule = {
@@ -223,10 +290,7 @@ class TestRuleAction:
     @pytest.fixture
     def test_email(self):
         """Create test email object."""
-        email = Mock(spec=Email)
-        email.id = 1
-        email.gmail_id = "test_gmail_id"
-        return email
+        return Email(id=1, gmail_id="test_gmail_id")
     
     def test_mark_as_read_action(self, action_executor, test_email, mock_gmail_service):
         """Test mark as read action."""
@@ -270,6 +334,50 @@ class TestRuleAction:
         result = action_executor.execute_action('unknown_action', test_email)
         
         assert result is False
+    
+    def test_queue_and_flush_actions(self, action_executor, test_email, mock_gmail_service):
+        """Test that queued actions are sent to Gmail together on flush."""
+        mock_gmail_service.execute_actions.return_value = [True, False]
+        
+        assert action_executor.queue_action('mark_read', test_email) is True
+        assert action_executor.queue_action('move:Important', test_email) is True
+        assert action_executor.queue_action('unknown_action', test_email) is False
+        
+        with patch('database.db_manager.update_emails_status', return_value=1) as mock_update:
+            results = action_executor.flush()
+        
+        assert results == [True, False]
+        mock_gmail_service.execute_actions.assert_called_once_with([
+            ('mark_as_read', 'test_gmail_id', None),
+            ('move', 'test_gmail_id', 'Important')
+        ])
+        mock_update.assert_any_call([1], is_read=True)
+        assert action_executor.flush() == []
+    
+    def test_flush_keeps_repeated_and_unsaved_entries(self, action_executor, mock_gmail_service):
+        """Test that flush reports each queued entry even without email IDs."""
+        mock_gmail_service.execute_actions.return_value = [True, False, True]
+        first = Email(gmail_id='unsaved_1')
+        second = Email(gmail_id='unsaved_2')
+        
+        action_executor.queue_action('archive', first)
+        action_executor.queue_action('archive', second)
+        action_executor.queue_action('archive', second)
+        
+        with patch('database.db_manager.update_emails_status', return_value=0):
+            assert action_executor.flush() == [True, False, True]
+    
+    def test_queue_actions_all_or_nothing(self, action_executor, test_email, mock_gmail_service):
+        """Test that an email's actions are not partly queued when one raises."""
+        mock_gmail_service.execute_actions.return_value = [True]
+        with pytest.raises(AttributeError):
+            action_executor.queue_actions(['archive', 42], test_email)
+        
+        assert action_executor.queue_actions(['archive', 'unknown_action'], test_email) == [True, False]
+        
+        with patch('database.db_manager.update_emails_status', return_value=0):
+            assert action_executor.flush() == [True]
+        mock_gmail_service.execute_actions.assert_called_once_with([('archive', 'test_gmail_id', None)])
 
 
 class TestRulesEngine:
@@ -280,6 +388,7 @@ class TestRulesEngine:
         """Mock Gmail service."""
         service = Mock()
         service.mark_as_read.return_value = True
+        service.execute_actions.side_effect = lambda actions: [True] * len(actions)
         return service
     
     @pytest.fixture
@@ -290,54 +399,112 @@ class TestRulesEngine:
     @pytest.fixture
     def test_email(self):
         """Create test email object."""
-        email = Mock(spec=Email)
-        email.id = 1
-        email.gmail_id = "test_gmail_id"
-        email.from_address = "test@example.com"
-        email.to_address = "user@gmail.com"
-        email.subject = "Test Email Subject"
-        email.body = "This is a test email body"
-        email.labels = '["INBOX", "UNREAD"]'
-        email.received_at = datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc)
-        return email
-    
-    def test_load_rules_valid_file(self, rules_engine, sample_rules):
+        return Email(
+            id=1,
+            gmail_id="test_gmail_id",
+            from_address="test@example.com",
+            to_address="user@gmail.com",
+            subject="Test Email Subject",
+            body="This is a test email body",
+            labels=['INBOX', 'UNREAD'],
+            received_at=datetime(2025, 9, 26, 12, 0, 0, tzinfo=timezone.utc)
+        )
+    
+    def test_load_rules_valid_file(self, rules_engine, temp_rules_file, sample_rules):
         """Test loading valid rules file."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            json.dump(sample_rules, temp_file)
-            temp_file.flush()
-            temp_file_path = temp_file.name
-            
-        loaded_rules = rules_engine.load_rules(temp_file_path)
+        loaded_rules = rules_engine.load_rules(temp_rules_file)
         
         assert loaded_rules is not None
         assert loaded_rules['id'] == sample_rules['id']
         assert loaded_rules['predicate'] == sample_rules['predicate']
+    
+    def test_date_values_parsed_at_load(self, rules_engine, test_email):
+        """Test that date rule values are parsed once, not per evaluation."""
+        rules_config = {
+            'predicate': 'ALL',
+            'rules': [
+                {'field': 'received_date', 'predicate': 'after', 'value': '2025-09-01'},
+                {'field': 'received_date', 'predicate': 'greater than', 'value': '1'}
+            ]
+        }
+        rules_engine._prepare_rules(rules_config)
         
-        try:
-            os.unlink(temp_file_path)
-        except (OSError, PermissionError):
-            pass
+        assert rules_config['rules'][0]['_date_value'] == datetime(2025, 9, 1)
+        assert rules_config['rules'][1]['_date_value'] == 1
+        
+        with patch('rules_engine.date_parser.parse') as mock_parse:
+            assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is True
+        
+        mock_parse.assert_not_called()
+    
+    def test_pinned_date_cutoffs(self, rules_engine, test_email):
+        """Test that relative date rules use the cutoff pinned for the pass."""
+        rules_config = {
+            'predicate': 'ALL',
+            'rules': [{'field': 'received_date', 'predicate': 'less than', 'value': '7'}]
+        }
+        rules_engine._prepare_rules(rules_config)
+        
+        pinned_now = _pin_clock(datetime(2025, 9, 30, tzinfo=timezone.utc))
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config, pinned_now) is True
+        
+        test_email.received_at = test_email.received_at.replace(tzinfo=None)
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config, pinned_now) is True
+        
+        # The pinned time is passed per call; the shared rules are left untouched
+        assert set(rules_config['rules'][0]) == {'field', 'predicate', 'value', '_date_value', '_matcher'}
+        
+        # Without it, the rule compares against the current time
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is False
+        test_email.received_at = datetime.now(timezone.utc) - timedelta(days=1)
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is True
+    
+    def test_load_rules_without_orjson(self, rules_engine, temp_rules_file, sample_rules):
+        """Test that rules load with the stdlib parser when orjson is unavailable."""
+        with patch('rules_engine.orjson', None):
+            loaded_rules = rules_engine.load_rules(temp_rules_file)
+        
+        assert loaded_rules['id'] == sample_rules['id']
+    
+    def test_load_rules_cached_until_file_changes(self, rules_engine, temp_rules_file, sample_rules):
+        """Test that an unchanged rules file is parsed only once."""
+        first = rules_engine.load_rules(temp_rules_file)
+        assert rules_engine.load_rules(temp_rules_file) is first
+        
+        # Other engines reuse the parsed rules as well
+        assert RulesEngine(None).load_rules(temp_rules_file) is first
+        
+        with open(temp_rules_file, 'w') as f:
+            json.dump(dict(sample_rules, id='updated_rule'), f)
+        
+        assert rules_engine.load_rules(temp_rules_file)['id'] == 'updated_rule'
     
     def test_load_rules_nonexistent_file(self, rules_engine):
         """Test loading non-existent rules file."""
         loaded_rules = rules_engine.load_rules('nonexistent.json')
         assert loaded_rules is None
     
-    def test_load_rules_invalid_json(self, rules_engine):
-        """Test loading invalid JSON file."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            temp_file.write('invalid json content')
-            temp_file.flush()
-            temp_file_path = temp_file.name
-            
-        loaded_rules = rules_engine.load_rules(temp_file_path)
-        assert loaded_rules is None
+    def test_load_rules_invalid_json(self, rules_engine, temp_dir):
+        """Test loading a rules file with invalid JSON."""
+        rules_file = os.path.join(temp_dir, 'invalid.json')
+        with open(rules_file, 'w') as f:
+            f.write('invalid json content')
         
-        try:
-            os.unlink(temp_file_path)
-        except (OSError, PermissionError):
-            pass
+        assert rules_engine.load_rules(rules_file) is None
+    
+    def test_parse_rules(self, rules_engine, sample_rules):
+        """Test parsing rules from an in-memory JSON document."""
+        parsed_rules = rules_engine.parse_rules(json.dumps(sample_rules))
+        
+        assert parsed_rules['id'] == sample_rules['id']
+        assert len(parsed_rules['_matchers']) == len(sample_rules['rules'])
+    
+    def test_parse_rules_invalid_json(self, rules_engine):
+        """Test parsing invalid JSON."""
+        assert rules_engine.parse_rules('invalid json content') is None
+        
+        with patch('rules_engine.orjson', None):
+            assert rules_engine.parse_rules(b'invalid json content') is None
     
     def test_evaluate_email_all_predicate(self, rules_engine, test_email, sample_rules):
         """Test evaluating email with ALL predicate."""
@@ -364,6 +531,173 @@ class TestRulesEngine:
         result = rules_engine.evaluate_email_against_rules(test_email, sample_rules)
         assert result is False
     
+    def test_compiled_rules_match(self, rules_engine, test_email, sample_rules):
+        """Test that prepared rules evaluate through their compiled functions."""
+        sample_rules['rules'].append({'field': 'subject', 'predicate': 'matches', 'value': r'email \w+'})
+        rules_engine._prepare_rules(sample_rules)
+        
+        assert all(rule['_matcher'](test_email) for rule in sample_rules['rules'])
+        assert compile_rule({'field': 'from', 'predicate': 'equals', 'value': 'x@y.com'})(test_email) is False
+        assert compile_rule({'field': 'unknown_field', 'predicate': 'contains', 'value': 'test'}) is None
+        
+        with patch.object(rules_engine.evaluator, 'evaluate_rule') as mock_evaluate:
+            assert rules_engine.evaluate_email_against_rules(test_email, sample_rules) is True
+        mock_evaluate.assert_not_called()
+    
+    def test_uncompilable_rule_never_matches(self, rules_engine, test_email):
+        """Test that rules compile_rule rejects fall back to never matching."""
+        rules_config = {
+            'predicate': 'ANY',
+            'rules': [
+                {'field': 'unknown_field', 'predicate': 'contains', 'value': 'test'},
+                {'field': 'from', 'predicate': 'unknown_predicate', 'value': 'test'},
+                {'field': 'received_date', 'predicate': 'before', 'value': 'not a date'}
+            ]
+        }
+        rules_engine._prepare_rules(rules_config)
+        
+        assert len(rules_config['_matchers']) == 3
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is False
+    
+    def test_evaluate_email_short_circuits(self, rules_engine, test_email):
+        """Test that evaluation stops once a cheap rule decides the result."""
+        rules_config = {
+            'predicate': 'ALL',
+            'rules': [
+                {'field': 'subject', 'predicate': 'matches', 'value': r'test \w+'},
+                {'field': 'from', 'predicate': 'equals', 'value': 'nobody@example.com'}
+            ]
+        }
+        rules_engine._prepare_rules(rules_config)
+        assert rules_config['_rules_sorted'][-1]['predicate'] == 'matches'
+        
+        matchers = [Mock(wraps=matcher) for matcher in rules_config['_matchers']]
+        rules_config['_matchers'] = matchers
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is False
+        
+        # The regex rule is ordered last and never runs
+        assert [matcher.call_count for matcher in matchers] == [1, 0]
+        
+        with patch.object(rules_engine.evaluator, 'evaluate_rule',
+                          wraps=rules_engine.evaluator.evaluate_rule) as mock_evaluate:
+            rules_engine.evaluator.result_cache = {}
+            assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is False
+        
+        # With results cached, rules go through RuleEvaluator and stop just as early
+        assert mock_evaluate.call_count == 1
+        
+        # ANY stops at the first matching rule
+        rules_engine.evaluator.result_cache = None
+        rules_config['predicate'] = 'ANY'
+        rules_config['_rules_sorted'][0]['value'] = 'test@example.com'
+        rules_config['_matchers'] = matchers = [
+            Mock(wraps=compile_rule(rule)) for rule in rules_config['_rules_sorted']
+        ]
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is True
+        assert [matcher.call_count for matcher in matchers] == [1, 0]
+    
+    def test_shared_field_lowercased_once(self, rules_engine, test_email):
+        """Test that rules on the same field lowercase it once per email."""
+        class CountingStr(str):
+            lower_calls = 0
+            
+            def lower(self):
+                CountingStr.lower_calls += 1
+                return super().lower()
+        
+        test_email.body = CountingStr(test_email.body)
+        rules_config = {
+            'predicate': 'ALL',
+            'rules': [
+                {'field': 'body', 'predicate': 'contains', 'value': 'Test Email'},
+                {'field': 'body', 'predicate': 'does not contain', 'value': 'Unsubscribe'}
+            ]
+        }
+        rules_engine._prepare_rules(rules_config)
+        
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is True
+        assert CountingStr.lower_calls == 1
+        
+        # Rules evaluated through RuleEvaluator share the lowered value as well
+        rules_engine.evaluator.result_cache = {}
+        assert rules_engine.evaluate_email_against_rules(test_email, rules_config) is True
+        assert CountingStr.lower_calls == 2
+    
+    def test_rules_to_sql_filter(self, rules_engine, temp_db, sample_email_data, sample_rules):
+        """Test that the SQL prefilter keeps matching emails and drops others."""
+        other_email_data = dict(sample_email_data, gmail_id='other_email', subject='Hello 100%')
+        temp_db.save_emails([sample_email_data, other_email_data])
+        
+        filter_clause = rules_engine.rules_to_sql_filter(sample_rules)
+        emails = temp_db.get_emails(filter_clause=filter_clause)
+        
+        assert [email.gmail_id for email in emails] == [sample_email_data['gmail_id']]
+        
+        sample_rules['rules'].append({'field': 'subject', 'predicate': 'matches', 'value': r'\d+%'})
+        sample_rules['predicate'] = 'ANY'
+        assert rules_engine.rules_to_sql_filter(sample_rules) is None
+    
+    def test_rules_to_sql_filter_dates(self, rules_engine, temp_db, sample_email_data):
+        """Test that date rules become widened received_at bounds."""
+        temp_db.save_email(sample_email_data)
+        
+        def matching(predicate, value):
+            rules_config = {'rules': [{'field': 'received_date', 'predicate': predicate, 'value': value}]}
+            return len(temp_db.get_emails(filter_clause=rules_engine.rules_to_sql_filter(rules_config)))
+        
+        assert matching('after', '2025-09-25') == 1
+        assert matching('after', '2025-09-28') == 0
+        assert matching('before', '2025-09-24') == 0
+        assert matching('equals', '2025-09-26') == 1
+    
+    def test_apply_multiple_rule_sets_shares_rule_results(self, rules_engine, test_email, sample_rules, temp_dir):
+        """Test that a rule repeated across rule sets is evaluated once per email."""
+        rule_files = []
+        for name in ('first', 'second'):
+            rule_file = os.path.join(temp_dir, f'{name}.json')
+            with open(rule_file, 'w') as f:
+                json.dump(dict(sample_rules, id=name), f)
+            rule_files.append(rule_file)
+        
+        matchers = []
+        
+        def counting_compile_rule(rule):
+            matcher = Mock(wraps=compile_rule(rule))
+            matchers.append(matcher)
+            return matcher
+        
+        with patch('rules_engine.compile_rule', side_effect=counting_compile_rule):
+            with patch('database.db_manager.log_rules_applied', return_value=1):
+                with patch('database.db_manager.update_emails_status', return_value=1):
+                    results = rules_engine.apply_multiple_rule_sets([test_email], rule_files)
+        
+        assert [stats['matched'] for stats in results['rule_set_results'].values()] == [1, 1]
+        assert sum(matcher.call_count for matcher in matchers) == len(sample_rules['rules'])
+        assert rules_engine.evaluator.result_cache is None
+    
+    def test_apply_multiple_rule_sets_unsaved_emails(self, rules_engine, temp_dir):
+        """Test that cached rule results are kept apart for emails without an id."""
+        emails = [
+            Email(gmail_id='spam', from_address='spam@x.com', received_at=datetime.now()),
+            Email(gmail_id='friend', from_address='friend@y.com', received_at=datetime.now())
+        ]
+        rule_files = []
+        for name in ('first', 'second'):
+            rule_file = os.path.join(temp_dir, f'{name}.json')
+            with open(rule_file, 'w') as f:
+                json.dump({
+                    'id': name,
+                    'predicate': 'ALL',
+                    'rules': [{'field': 'from', 'predicate': 'contains', 'value': 'spam'}],
+                    'actions': ['archive']
+                }, f)
+            rule_files.append(rule_file)
+        
+        with patch('database.db_manager.log_rules_applied', return_value=1):
+            for ordered in (emails, emails[::-1]):
+                results = rules_engine.apply_multiple_rule_sets(ordered, rule_files)
+                assert [stats['matched'] for stats in results['rule_set_results'].values()] == [1, 1]
+    
     def test_apply_rules_to_email_success(self, rules_engine, test_email, sample_rules, mock_gmail_service):
         """Test applying rules to email successfully."""
         with patch('database.db_manager.log_rule_applied', return_value=Mock()):
@@ -381,24 +715,20 @@ class TestRulesEngine:
         result = rules_engine.apply_rules_to_email(test_email, sample_rules)
         assert result is False
     
-    def test_apply_rules_to_emails(self, rules_engine, test_email, sample_rules):
+    def test_apply_rules_to_emails(self, rules_engine, test_email, temp_rules_file):
         """Test applying rules to multiple emails."""
         emails = [test_email]
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            json.dump(sample_rules, temp_file)
-            temp_file.flush()
-            temp_file_path = temp_file.name
-            
-        with patch('database.db_manager.log_rule_applied', return_value=Mock()):
-            with patch('database.db_manager.update_email_status', return_value=True):
-                stats = rules_engine.apply_rules_to_emails(emails, temp_file_path)
+        with patch('database.db_manager.log_rules_applied', return_value=1) as mock_log:
+            with patch('database.db_manager.update_emails_status', return_value=1) as mock_update:
+                stats = rules_engine.apply_rules_to_emails(emails, temp_rules_file)
                 
                 assert stats['processed'] == 1
                 assert stats['matched'] == 1
                 assert stats['failed'] == 0
-        
-        try:
-            os.unlink(temp_file_path)
-        except (OSError, PermissionError):
-            pass
\ No newline at end of file
+                
+                logged = mock_log.call_args[0][0]
+                assert len(logged) == 1
+                assert logged[0]['email_id'] == test_email.id
+                assert logged[0]['actions'] == ['mark_as_read']
+                mock_update.assert_any_call([test_email.id], is_read=True)
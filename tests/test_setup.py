@@ -0,0 +1,42 @@
+"""
+Tests for the setup script.
+"""
+
+import pytest
+
+import setup
+
+
+class TestCreateEnvFile:
+    """Test create_env_file."""
+    
+    @pytest.fixture(autouse=True)
+    def work_dir(self, tmp_path, monkeypatch):
+        """Run each test in an empty working directory."""
+        monkeypatch.chdir(tmp_path)
+        return tmp_path
+    
+    def test_creates_env_from_template(self, work_dir, capsys):
+        """Test that .env is copied from .env.example."""
+        (work_dir / '.env.example').write_text('LOG_LEVEL=INFO\n')
+        
+        setup.create_env_file()
+        
+        assert (work_dir / '.env').read_text() == 'LOG_LEVEL=INFO\n'
+        assert 'Created .env file' in capsys.readouterr().out
+    
+    def test_existing_env_without_template(self, work_dir, capsys):
+        """Test that an existing .env is reported even when the template is missing."""
+        (work_dir / '.env').write_text('LOG_LEVEL=DEBUG\n')
+        
+        setup.create_env_file()
+        
+        assert (work_dir / '.env').read_text() == 'LOG_LEVEL=DEBUG\n'
+        assert '.env file already exists' in capsys.readouterr().out
+    
+    def test_missing_template(self, work_dir, capsys):
+        """Test that no empty .env is left behind when the template is missing."""
+        setup.create_env_file()
+        
+        assert not (work_dir / '.env').exists()
+        assert '.env.example not found' in capsys.readouterr().out